@@ -0,0 +1,177 @@
+import asyncio
+
+from bson import SON
+from pymongo import ASCENDING, DESCENDING
+
+ID_FIELD = "id"
+SCORE_FIELD = "score"
+
+ADMIN_SCORES_PIPELINE = [
+    {
+        u"$group": {
+            u"_id": u"$id",
+            u"maxScore": {
+                u"$max": {
+                    u"$mergeObjects": [
+                         {
+                             u"score": u"$score"
+                         },
+                        u"$$ROOT"
+                    ]
+                }
+            }
+        }
+    },
+    {
+        u"$replaceRoot": {
+            u"newRoot": u"$maxScore"
+        }
+    },
+    {
+        u"$sort": SON([(u"score", -1)])
+    }]
+
+ADMIN_SCORES_INDEX = [(ID_FIELD, ASCENDING), (SCORE_FIELD, DESCENDING)]
+
+# Sorting on the (id, score) index lets $group take the first document of each id
+# from the index instead of merging whole documents
+_BEST_SCORES = [
+    {u"$sort": SON([(ID_FIELD, ASCENDING), (SCORE_FIELD, DESCENDING)])},
+    {u"$group": {u"_id": u"$" + ID_FIELD, SCORE_FIELD: {u"$first": u"$" + SCORE_FIELD}}}
+]
+
+_BY_SCORE = {u"$sort": SON([(SCORE_FIELD, DESCENDING), (u"_id", ASCENDING)])}
+
+_AS_SCORE = {u"$project": {u"_id": 0, ID_FIELD: u"$_id", SCORE_FIELD: 1}}
+
+
+async def ensure_admin_scores_index(collection):
+    await collection.create_index(ADMIN_SCORES_INDEX)
+
+
+async def get_top_admin_scores(collection, limit: int, skip: int = 0, timeout: float = 5) -> list:
+    pipeline = _BEST_SCORES + [_BY_SCORE]
+    if skip > 0:
+        pipeline.append({u"$skip": skip})
+    pipeline += [{u"$limit": limit}, _AS_SCORE]
+
+    return await asyncio.wait_for(collection.aggregate(pipeline).to_list(length=None), timeout)
+
+
+async def get_admin_score_bounds(collection, top: int, timeout: float = 5) -> tuple | None:
+    pipeline = _BEST_SCORES + [
+        {u"$facet": {
+            u"max": [_BY_SCORE, {u"$limit": 1}],
+            u"min": [_BY_SCORE, {u"$skip": top - 1}, {u"$limit": 1}],
+            u"last": [{u"$sort": SON([(SCORE_FIELD, ASCENDING)])}, {u"$limit": 1}]
+        }}
+    ]
+    documents = await asyncio.wait_for(collection.aggregate(pipeline).to_list(length=None), timeout)
+    if len(documents) <= 0 or len(documents[0][u"max"]) <= 0:
+        return None
+
+    bounds = documents[0]
+    # Fewer identities than the top, the lowest one is the boundary
+    min_document = bounds[u"min"][0] if len(bounds[u"min"]) > 0 else bounds[u"last"][0]
+    return min_document[SCORE_FIELD], bounds[u"max"][0][SCORE_FIELD]
+
+
+async def get_admin_user_score(collection, user_id: str, timeout: float = 5) -> tuple | None:
+    pipeline = [
+        {u"$match": {ID_FIELD: user_id}},
+        {u"$sort": SON([(SCORE_FIELD, DESCENDING)])},
+        {u"$limit": 1},
+        {u"$project": {u"_id": 0, SCORE_FIELD: 1}}
+    ]
+    documents = await asyncio.wait_for(collection.aggregate(pipeline).to_list(length=None), timeout)
+    if len(documents) <= 0:
+        return None
+
+    score = documents[0][SCORE_FIELD]
+    # Ranked by (-score, id) like _BY_SCORE and the view, equal scores are ordered by id
+    pipeline = _BEST_SCORES + [
+        {u"$match": {u"$or": [{SCORE_FIELD: {u"$gt": score}},
+                              {SCORE_FIELD: score, u"_id": {u"$lt": user_id}}]}},
+        {u"$count": u"higher"}
+    ]
+    documents = await asyncio.wait_for(collection.aggregate(pipeline).to_list(length=None), timeout)
+    higher = documents[0][u"higher"] if len(documents) > 0 else 0
+    return (higher + 1, user_id, score)
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import string
+    import time
+
+    import bson
+    import motor.motor_asyncio
+
+    NUMBER_OF_IDS = 2000
+    DOCUMENTS_PER_ID = 10
+    TOP = 676
+    RUNS = 20
+
+    class CountingCollection():
+        def __init__(self, collection) -> None:
+            self.collection = collection
+            self.documents = 0
+            self.transferred = 0
+
+        def aggregate(self, pipeline: list):
+            cursor = self.collection.aggregate(pipeline)
+            counter = self
+
+            class CountingCursor():
+                async def to_list(self, length=None):
+                    documents = await cursor.to_list(length=length)
+                    counter.documents += len(documents)
+                    counter.transferred += sum(len(bson.encode(d)) for d in documents)
+                    return documents
+
+            return CountingCursor()
+
+    async def measure(name: str, collection: CountingCollection, func):
+        collection.documents = collection.transferred = 0
+        started = time.perf_counter()
+        for _ in range(RUNS):
+            await func()
+        elapsed = (time.perf_counter() - started) / RUNS
+        print(f'{name:<20} {elapsed * 1000:>8.2f} ms {collection.documents // RUNS:>6} docs '
+              f'{collection.transferred // RUNS:>9} bytes')
+
+    async def main():
+        client = motor.motor_asyncio.AsyncIOMotorClient(os.getenv('MONGO_BENCH_URI', 'mongodb://localhost:27017'))
+        collection = client['qubic-bench']['latestAdminScore']
+        await collection.drop()
+
+        random.seed(0)
+        ids = [''.join(random.choices(string.ascii_uppercase, k=70)) for _ in range(NUMBER_OF_IDS)]
+        await collection.insert_many([{ID_FIELD: id, SCORE_FIELD: random.randrange(10000),
+                                       'timestamp': time.time(), 'computorIndex': random.randrange(TOP)}
+                                      for id in ids for _ in range(DOCUMENTS_PER_ID)])
+        await ensure_admin_scores_index(collection)
+        user_id = random.choice(ids)
+
+        counting = CountingCollection(collection)
+
+        async def full_pipeline():
+            return await counting.aggregate(ADMIN_SCORES_PIPELINE).to_list(length=None)
+
+        full = await full_pipeline()
+        min_index = TOP - 1 if len(full) > TOP - 1 else -1
+        assert await get_admin_score_bounds(collection, TOP) == (full[min_index][SCORE_FIELD], full[0][SCORE_FIELD])
+        user = await get_admin_user_score(collection, user_id)
+        ranked = sorted(full, key=lambda document: (-document[SCORE_FIELD], document[ID_FIELD]))
+        assert ranked[user[0] - 1][ID_FIELD] == user_id and user[2] == ranked[user[0] - 1][SCORE_FIELD]
+
+        print(f'{NUMBER_OF_IDS} ids x {DOCUMENTS_PER_ID} documents, mean of {RUNS} runs')
+        await measure('full pipeline', counting, full_pipeline)
+        await measure('bounds pushdown', counting, lambda: get_admin_score_bounds(counting, TOP))
+        await measure('user pushdown', counting, lambda: get_admin_user_score(counting, user_id))
+        await measure('top 10 pushdown', counting, lambda: get_top_admin_scores(counting, 10))
+
+        await collection.drop()
+
+    asyncio.run(main())
@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import time
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from utils.scoreranking import ScoreRanking
+
+# The $changeStream stage is only supported on replica sets
+_CHANGE_STREAM_UNSUPPORTED = 40573
+
+
+class AdminScoresView():
+    def __init__(self, collection, pipeline: list, id_field: str = 'id', score_field: str = 'score',
+                 timestamp_field: str = 'timestamp', poll_interval: float = 5.0, timeout: float = 5.0,
+                 retry_delay: float = 5.0, reseed_interval: float = 300.0) -> None:
+        self.__collection = collection
+        self.__pipeline = pipeline
+        self.__id_field = id_field
+        self.__score_field = score_field
+        self.__timestamp_field = timestamp_field
+        self.__poll_interval = poll_interval
+        self.__timeout = timeout
+        self.__retry_delay = retry_delay
+        self.__reseed_interval = reseed_interval
+        self.__ranking = ScoreRanking(score_field=score_field)
+        self.__last_timestamp = None
+        self.__ready = False
+        self.__needs_seed = True
+        self.__use_change_stream = True
+        self.__task = None
+        self.__metrics = {'seeds': 0, 'changes': 0, 'polls': 0, 'requeries': 0, 'errors': 0}
+
+    @property
+    def is_ready(self) -> bool:
+        return self.__ready
+
+    @property
+    def mode(self) -> str:
+        return 'change_stream' if self.__use_change_stream else 'polling'
+
+    @property
+    def metrics(self) -> dict:
+        metrics = dict(self.__metrics)
+        metrics['mode'] = self.mode
+        metrics['ready'] = self.__ready
+        metrics['entries'] = len(self.__ranking)
+        return metrics
+
+    async def ensure_indexes(self):
+        await self.__collection.create_index([(self.__timestamp_field, ASCENDING)])
+        await self.__collection.create_index([(self.__id_field, ASCENDING), (self.__score_field, DESCENDING)])
+
+    async def seed(self):
+        cursor = self.__collection.aggregate(self.__pipeline)
+        documents = await asyncio.wait_for(cursor.to_list(length=None), self.__timeout)
+        self.__ranking.update({document[self.__id_field]: document for document in documents
+                               if self.__id_field in document})
+        self.__last_timestamp = max((document.get(self.__timestamp_field) for document in documents
+                                     if document.get(self.__timestamp_field) is not None), default=None)
+        self.__metrics['seeds'] += 1
+        self.__needs_seed = False
+        self.__ready = True
+        logging.info(f'AdminScoresView: seeded {len(self.__ranking)} identities')
+
+    async def __best_document(self, id) -> dict | None:
+        pipeline = [{'$match': {self.__id_field: id}},
+                    {'$sort': {self.__score_field: DESCENDING}},
+                    {'$limit': 1}]
+        documents = await asyncio.wait_for(self.__collection.aggregate(pipeline).to_list(length=None),
+                                           self.__timeout)
+        self.__metrics['requeries'] += 1
+        return documents[0] if len(documents) > 0 else None
+
+    async def apply(self, document: dict) -> bool:
+        id = document.get(self.__id_field)
+        if id is None:
+            return False
+
+        timestamp = document.get(self.__timestamp_field)
+        if timestamp is not None and (self.__last_timestamp is None or timestamp > self.__last_timestamp):
+            self.__last_timestamp = timestamp
+
+        # The view keeps the best score per identity, as the $group/$max pipeline does
+        current = self.__ranking.get(id)
+        if current is not None and document.get(self.__score_field, 0) < current.get(self.__score_field, 0):
+            # A lower score of another document changes nothing, but the held best one may have gone down
+            if current.get('_id') is None or current.get('_id') != document.get('_id'):
+                return False
+
+            best = await self.__best_document(id)
+            if best is not None:
+                document = best
+
+        return self.__ranking.set(id, document)
+
+    async def __watch(self):
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+        async with self.__collection.watch(pipeline, full_document='updateLookup') as stream:
+            # Anything written between the seed and opening the stream
+            await self.__poll_once()
+            async for change in stream:
+                self.__metrics['changes'] += 1
+                if change['operationType'] == 'delete':
+                    # A removed document can lower the best score, only a reseed can tell
+                    await self.seed()
+                    continue
+
+                document = change.get('fullDocument')
+                if document is not None:
+                    await self.apply(document)
+
+    async def __poll_once(self):
+        query = dict()
+        if self.__last_timestamp is not None:
+            query[self.__timestamp_field] = {'$gte': self.__last_timestamp}
+
+        cursor = self.__collection.find(query).sort(self.__timestamp_field, ASCENDING)
+        for document in await asyncio.wait_for(cursor.to_list(length=None), self.__timeout):
+            await self.apply(document)
+
+        self.__metrics['polls'] += 1
+
+    async def __poll(self):
+        last_seed = time.monotonic()
+        while True:
+            await asyncio.sleep(self.__poll_interval)
+            # Polling cannot see deletes, a periodic reseed drops what was removed
+            if self.__reseed_interval > 0 and time.monotonic() - last_seed >= self.__reseed_interval:
+                await self.seed()
+                last_seed = time.monotonic()
+            else:
+                await self.__poll_once()
+
+    async def run(self):
+        try:
+            await self.ensure_indexes()
+        except Exception as e:
+            logging.warning(f'AdminScoresView: failed to create indexes: {e!r}')
+
+        while True:
+            try:
+                if self.__needs_seed:
+                    await self.seed()
+
+                if self.__use_change_stream:
+                    await self.__watch()
+                else:
+                    await self.__poll()
+            except asyncio.CancelledError as e:
+                raise e
+            except OperationFailure as e:
+                if e.code == _CHANGE_STREAM_UNSUPPORTED and self.__use_change_stream:
+                    logging.warning('AdminScoresView: change streams are not supported, falling back to polling')
+                    self.__use_change_stream = False
+                    continue
+
+                self.__on_error(e)
+                await asyncio.sleep(self.__retry_delay)
+            except Exception as e:
+                self.__on_error(e)
+                await asyncio.sleep(self.__retry_delay)
+
+    def __on_error(self, e: Exception):
+        logging.exception(e)
+        self.__metrics['errors'] += 1
+        # Changes may have been missed while the stream was down, the old data is served until the reseed
+        if self.__use_change_stream:
+            self.__needs_seed = True
+
+    def start(self):
+        if self.__task is None or self.__task.done():
+            self.__task = asyncio.create_task(self.run(), name='admin_scores_view')
+
+    async def stop(self):
+        if self.__task is not None:
+            self.__task.cancel()
+            await asyncio.wait({self.__task})
+
+    def ranking(self) -> list:
+        return [data for _, data in self.__ranking]
+
+    def min_max(self) -> tuple:
+        if len(self.__ranking) <= 0:
+            raise ValueError()
+
+        return self.__ranking.min_score, self.__ranking.max_score
+
+    def get_user(self, user_id: str) -> tuple | None:
+        data = self.__ranking.get(user_id)
+        if data is None:
+            return None
+
+        return (self.__ranking.rank(user_id), user_id, data.get(self.__score_field, 0))
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import string
+    import sys
+
+    import motor.motor_asyncio
+
+    from bd.adminscorequeries import ADMIN_SCORES_PIPELINE
+
+    # Checks the view against the full pipeline on a live mongod (MONGO_BENCH_URI).
+    # A replica set runs the change stream mode, a standalone server the polling mode
+    NUMBER_OF_IDS = 300
+    DOCUMENTS_PER_ID = 5
+    CHANGES = 100
+    POLL_INTERVAL = 0.2
+    CONVERGE_TIMEOUT = 10
+
+    async def expected_scores(collection) -> dict:
+        documents = await collection.aggregate(ADMIN_SCORES_PIPELINE).to_list(length=None)
+        return {document['id']: document['score'] for document in documents}
+
+    def view_scores(view: AdminScoresView) -> dict:
+        return {document['id']: document['score'] for document in view.ranking()}
+
+    async def converge(name: str, view: AdminScoresView, collection) -> bool:
+        expected = await expected_scores(collection)
+        started = time.perf_counter()
+        while view_scores(view) != expected:
+            if time.perf_counter() - started > CONVERGE_TIMEOUT:
+                got = view_scores(view)
+                wrong = [id for id in expected.keys() | got.keys() if expected.get(id) != got.get(id)]
+                print(f'{name:<8} MISMATCH after {CONVERGE_TIMEOUT} s, {len(wrong)} identities differ')
+                return False
+
+            await asyncio.sleep(POLL_INTERVAL / 4)
+
+        ranking = [document['score'] for document in view.ranking()]
+        ordered = all(a >= b for a, b in zip(ranking, ranking[1:]))
+        print(f'{name:<8} matches the pipeline in {(time.perf_counter() - started) * 1000:.0f} ms '
+              f'({len(expected)} identities, {view.mode}){"" if ordered else ", NOT ORDERED"}')
+        return ordered
+
+    async def main() -> bool:
+        client = motor.motor_asyncio.AsyncIOMotorClient(os.getenv('MONGO_BENCH_URI', 'mongodb://localhost:27017'))
+        collection = client['qubic-bench']['latestAdminScoreView']
+        await collection.drop()
+
+        random.seed(0)
+        ids = [''.join(random.choices(string.ascii_uppercase, k=70)) for _ in range(NUMBER_OF_IDS)]
+        await collection.insert_many([{'id': id, 'score': random.randrange(10000), 'timestamp': time.time()}
+                                      for id in ids for _ in range(DOCUMENTS_PER_ID)])
+
+        view = AdminScoresView(collection, ADMIN_SCORES_PIPELINE, poll_interval=POLL_INTERVAL,
+                               reseed_interval=POLL_INTERVAL * 5)
+        view.start()
+        ok = True
+        try:
+            started = time.perf_counter()
+            while not view.is_ready:
+                if time.perf_counter() - started > CONVERGE_TIMEOUT:
+                    print(f'seed     not ready after {CONVERGE_TIMEOUT} s')
+                    return False
+                await asyncio.sleep(POLL_INTERVAL / 4)
+            ok = await converge('seed', view, collection) and ok
+
+            await collection.insert_many([{'id': random.choice(ids), 'score': random.randrange(10000),
+                                           'timestamp': time.time()} for _ in range(CHANGES)])
+            ok = await converge('inserts', view, collection) and ok
+
+            # Lowering the best document of an identity is what the view cannot see without a requery
+            for document in (await collection.aggregate(ADMIN_SCORES_PIPELINE).to_list(length=None))[:CHANGES]:
+                await collection.update_one({'_id': document['_id']},
+                                            {'$set': {'score': document['score'] // 2, 'timestamp': time.time()}})
+            for document in await collection.aggregate([{'$sample': {'size': CHANGES}}]).to_list(length=None):
+                await collection.replace_one({'_id': document['_id']},
+                                             {'id': document['id'], 'score': random.randrange(10000),
+                                              'timestamp': time.time()})
+            ok = await converge('updates', view, collection) and ok
+
+            for document in (await collection.aggregate(ADMIN_SCORES_PIPELINE).to_list(length=None))[:CHANGES]:
+                await collection.delete_one({'_id': document['_id']})
+            await collection.delete_many({'id': {'$in': ids[:10]}})
+            ok = await converge('deletes', view, collection) and ok
+            print(f'metrics {view.metrics}')
+        finally:
+            await view.stop()
+            await collection.drop()
+
+        return ok
+
+    sys.exit(0 if asyncio.run(main()) else 1)
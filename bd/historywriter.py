@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from types import MappingProxyType
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+_DUPLICATE_KEY = 11000
+
+
+class HistoryWriter():
+    def __init__(self, collection, max_batch: int = 500, flush_interval: float = 5.0, max_buffer: int = 10000,
+                 keyframe_every: int = 100, retry_delay: float = 5.0, max_retries: int = 5,
+                 timeout: float = 10.0) -> None:
+        self.__collection = collection
+        self.__max_batch = max_batch
+        self.__flush_interval = flush_interval
+        self.__max_buffer = max_buffer
+        self.__keyframe_every = keyframe_every
+        self.__retry_delay = retry_delay
+        self.__max_retries = max_retries
+        self.__timeout = timeout
+        self.__buffer = deque()
+        # (attempts, document) of failed flushes, written before the buffer
+        self.__retry = deque()
+        self.__last = dict()
+        self.__since_keyframe = dict()
+        self.__wakeup = asyncio.Event()
+        self.__task = None
+        self.__metrics = {'queued': 0, 'written': 0, 'flushes': 0, 'failed_flushes': 0, 'retried': 0,
+                          'dropped': 0, 'duplicates': 0, 'unchanged': 0,
+                          'batch_total': 0, 'batch_max': 0, 'flush_total': 0.0, 'flush_max': 0.0}
+
+    @staticmethod
+    def __plain(data):
+        if isinstance(data, (dict, MappingProxyType)):
+            return {str(k): HistoryWriter.__plain(v) for k, v in data.items()}
+        if isinstance(data, (list, tuple)):
+            return [HistoryWriter.__plain(v) for v in data]
+
+        return data
+
+    def __document(self, subject: str, data, received: float, version: int) -> dict | None:
+        data = HistoryWriter.__plain(data)
+        last = self.__last.get(subject)
+        document = {'subject': subject, 'version': version, 'timestamp': received}
+        since_keyframe = self.__since_keyframe.get(subject, 0)
+        if last is None or since_keyframe + 1 >= self.__keyframe_every or not isinstance(data, dict):
+            if last is not None and data == last:
+                return None
+
+            document['keyframe'] = True
+            document['data'] = data
+            self.__since_keyframe[subject] = 0
+        else:
+            changes = {k: v for k, v in data.items() if last.get(k) != v}
+            removed = [k for k in last if k not in data]
+            if len(changes) <= 0 and len(removed) <= 0:
+                return None
+
+            document['changes'] = changes
+            if len(removed) > 0:
+                document['removed'] = removed
+            self.__since_keyframe[subject] = since_keyframe + 1
+
+        self.__last[subject] = data
+        return document
+
+    def add(self, subject: str, data, received: float = None, version: int = None):
+        document = self.__document(subject, data, received if received is not None else time.time(), version)
+        if document is None:
+            self.__metrics['unchanged'] += 1
+            return
+
+        while len(self.__buffer) + len(self.__retry) >= self.__max_buffer:
+            dropped = self.__retry.popleft()[1] if len(self.__retry) > 0 else self.__buffer.popleft()
+            self.__drop(dropped)
+
+        self.__buffer.append(document)
+        self.__metrics['queued'] += 1
+        if len(self.__buffer) >= self.__max_batch:
+            self.__wakeup.set()
+
+    def __drop(self, document: dict):
+        self.__metrics['dropped'] += 1
+        # Later diffs of that subject cannot be replayed without the dropped one, start over with a keyframe
+        self.__last.pop(document['subject'], None)
+
+    def __take_batch(self) -> tuple:
+        batch = []
+        attempts = []
+        while len(self.__retry) > 0 and len(batch) < self.__max_batch:
+            attempt, document = self.__retry.popleft()
+            attempts.append(attempt)
+            batch.append(document)
+
+        while len(self.__buffer) > 0 and len(batch) < self.__max_batch:
+            attempts.append(0)
+            batch.append(self.__buffer.popleft())
+
+        return batch, attempts
+
+    async def flush(self) -> bool:
+        batch, attempts = self.__take_batch()
+        if len(batch) <= 0:
+            return True
+
+        started = time.monotonic()
+        failed = []
+        try:
+            result = await asyncio.wait_for(self.__collection.insert_many(batch, ordered=False), self.__timeout)
+            written = len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Unordered inserts keep going past errors, only the failed documents are retried
+            written = e.details.get('nInserted', 0)
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') == _DUPLICATE_KEY:
+                    # Already written by an earlier attempt whose reply was lost
+                    self.__metrics['duplicates'] += 1
+                else:
+                    failed.append(error['index'])
+        except Exception as e:
+            logging.warning(f'HistoryWriter: failed to write {len(batch)} documents: {e!r}')
+            written = 0
+            failed = list(range(len(batch)))
+
+        elapsed = time.monotonic() - started
+        self.__metrics['flushes'] += 1
+        self.__metrics['written'] += written
+        self.__metrics['batch_total'] += len(batch)
+        self.__metrics['batch_max'] = max(self.__metrics['batch_max'], len(batch))
+        self.__metrics['flush_total'] += elapsed
+        self.__metrics['flush_max'] = max(self.__metrics['flush_max'], elapsed)
+
+        if len(failed) > 0:
+            self.__metrics['failed_flushes'] += 1
+            retry = []
+            for index in failed:
+                if attempts[index] + 1 > self.__max_retries:
+                    self.__drop(batch[index])
+                else:
+                    retry.append((attempts[index] + 1, batch[index]))
+
+            self.__metrics['retried'] += len(retry)
+            # The documents keep their _id, so a retry of a written one is a duplicate and not a copy
+            self.__retry.extendleft(reversed(retry))
+            return False
+
+        return True
+
+    async def ensure_indexes(self):
+        await self.__collection.create_index([('subject', ASCENDING), ('timestamp', ASCENDING)])
+
+    async def run(self):
+        try:
+            await self.ensure_indexes()
+        except Exception as e:
+            logging.warning(f'HistoryWriter: failed to create indexes: {e!r}')
+
+        while True:
+            try:
+                await asyncio.wait_for(self.__wakeup.wait(), self.__flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.__wakeup.clear()
+
+            while len(self.__retry) + len(self.__buffer) > 0:
+                if not await self.flush():
+                    await asyncio.sleep(self.__retry_delay)
+                    break
+
+                if len(self.__buffer) < self.__max_batch:
+                    break
+
+    def start(self):
+        if self.__task is None or self.__task.done():
+            self.__task = asyncio.create_task(self.run(), name='history_writer')
+
+    async def stop(self):
+        if self.__task is not None:
+            self.__task.cancel()
+            await asyncio.wait({self.__task})
+
+        while len(self.__retry) + len(self.__buffer) > 0:
+            if not await self.flush():
+                break
+
+    def __len__(self):
+        return len(self.__buffer) + len(self.__retry)
+
+    @property
+    def metrics(self) -> dict:
+        metrics = dict(self.__metrics)
+        flush_total = metrics.pop('flush_total')
+        batch_total = metrics.pop('batch_total')
+        metrics['flush_avg'] = flush_total / metrics['flushes'] if metrics['flushes'] > 0 else 0.0
+        metrics['batch_avg'] = batch_total / metrics['flushes'] if metrics['flushes'] > 0 else 0.0
+        metrics['buffered'] = len(self.__buffer)
+        metrics['retrying'] = len(self.__retry)
+        return metrics
+
+    def log_metrics(self):
+        logging.info(f'HistoryWriter: {self.metrics}')
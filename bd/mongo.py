@@ -6,8 +6,14 @@ from urllib.parse import quote_plus
 
 import aiohttp
 import motor.motor_asyncio
-from bson import SON
 from dotenv import load_dotenv
+from qubic.qubicdata import NUMBER_OF_COMPUTORS
+
+from bd import adminscorequeries
+from bd.adminscorequeries import ADMIN_SCORES_PIPELINE
+from bd.adminscoresview import AdminScoresView
+from bd.historywriter import HistoryWriter
+from bd.scorescache import ScoresCache
 
 load_dotenv()
 
@@ -28,6 +34,39 @@ scores_db = client_mongo["qubic-world"]
 scores_collection = scores_db["latestScore"]
 admin_scores_collection = scores_db["latestAdminScore"]
 
+__SCORES_URL = os.getenv("SCORES_URL", "http://qubic.world/api/v1/network/scores/")
+__http_session: aiohttp.ClientSession = None
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    global __http_session
+    if __http_session is None or __http_session.closed:
+        connector = aiohttp.TCPConnector(limit=int(os.getenv("HTTP_POOL_LIMIT", 10)),
+                                         keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60)),
+                                         ttl_dns_cache=300)
+        __http_session = aiohttp.ClientSession(connector=connector,
+                                               timeout=aiohttp.ClientTimeout(total=__CONNECT_TIMEOUT * 2))
+
+    return __http_session
+
+
+admin_scores_view = AdminScoresView(admin_scores_collection, ADMIN_SCORES_PIPELINE,
+                                    id_field=__ID_FIELD, score_field=__SCORE_FIELD,
+                                    timestamp_field=__TIMESTAMP_FIELD,
+                                    poll_interval=float(os.getenv("ADMIN_SCORES_POLL_INTERVAL", 5)),
+                                    timeout=__CONNECT_TIMEOUT,
+                                    reseed_interval=float(os.getenv("ADMIN_SCORES_RESEED_INTERVAL", 300)))
+
+history_writer = HistoryWriter(scores_db[os.getenv("SCORE_HISTORY_COLLECTION", "scoreHistory")],
+                               max_batch=int(os.getenv("SCORE_HISTORY_MAX_BATCH", 500)),
+                               flush_interval=float(os.getenv("SCORE_HISTORY_FLUSH_INTERVAL", 5)),
+                               max_buffer=int(os.getenv("SCORE_HISTORY_MAX_BUFFER", 10000)),
+                               keyframe_every=int(os.getenv("SCORE_HISTORY_KEYFRAME_EVERY", 100)))
+
+scores_cache = ScoresCache(__SCORES_URL, get_http_session,
+                           ttl=float(os.getenv("SCORES_CACHE_TTL", 10)), id_field=__ID_FIELD,
+                           failure_ttl=float(os.getenv("SCORES_CACHE_FAILURE_TTL", 2)))
+
 
 def score_to_pretty(id, score, timestamp) -> str:
     return f"{id} - {score:<4} - {datetime.fromtimestamp(timestamp)}"
@@ -53,67 +92,63 @@ async def get_pretty_user_score(user_id: str):
 
 
 async def get_user_scores(user_id: str):
-    if len(user_id) == "":
+    if user_id == "":
         raise ValueError("user_id cannot be empty")
 
-    scores = await get_scores()
+    score = await scores_cache.get_by_id(user_id)
+    if score is None:
+        return None
 
-    for score in scores:
-        id = score[__ID_FIELD]
-        if id == user_id:
-            return (id, score[__SCORE_FIELD], score[__TIMESTAMP_FIELD])
+    return (score[__ID_FIELD], score[__SCORE_FIELD], score[__TIMESTAMP_FIELD])
 
-    return None
 
-
-#TODO: replace
 async def get_scores():
-    try:
-        async with aiohttp.ClientSession() as session:
-            url = "http://qubic.world/api/v1/network/scores/"
-
-            async with session.get(url) as resp:
-                return await resp.json(encoding='utf-8')
-    except Exception as e:
-        logging.error(e)
-        return []
+    return await scores_cache.get()
 
 
 async def get_min_max_admin_scores():
-    admin_scores = await get_admin_scores()
-    if len(admin_scores) <= 0:
+    admin_scores_view.start()
+    if admin_scores_view.is_ready:
+        return admin_scores_view.min_max()
+
+    bounds = await adminscorequeries.get_admin_score_bounds(admin_scores_collection, NUMBER_OF_COMPUTORS,
+                                                               __CONNECT_TIMEOUT)
+    if bounds is None:
         raise ValueError()
 
-    min_index = 675 if len(admin_scores) > 675 else -1
-    return admin_scores[min_index][__SCORE_FIELD], admin_scores[0][__SCORE_FIELD]
+    return bounds
+
+
+async def get_top_admin_scores(limit: int, skip: int = 0):
+    admin_scores_view.start()
+    if admin_scores_view.is_ready:
+        return admin_scores_view.ranking()[skip:skip + limit]
+
+    return await adminscorequeries.get_top_admin_scores(admin_scores_collection, limit, skip, __CONNECT_TIMEOUT)
+
+
+async def get_admin_user_score(user_id: str):
+    if user_id == "":
+        raise ValueError("user_id cannot be empty")
+
+    admin_scores_view.start()
+    if admin_scores_view.is_ready:
+        return admin_scores_view.get_user(user_id)
+
+    return await adminscorequeries.get_admin_user_score(admin_scores_collection, user_id, __CONNECT_TIMEOUT)
 
 
 async def get_admin_scores():
-    pipeline = [
-        {
-            u"$group": {
-                u"_id": u"$id",
-                u"maxScore": {
-                    u"$max": {
-                        u"$mergeObjects": [
-                             {
-                                 u"score": u"$score"
-                             },
-                            u"$$ROOT"
-                        ]
-                    }
-                }
-            }
-        },
-        {
-            u"$replaceRoot": {
-                u"newRoot": u"$maxScore"
-            }
-        },
-        {
-            u"$sort": SON([(u"score", -1)])
-        }]
-    found_documents = admin_scores_collection.aggregate(pipeline)
+    # The view is seeded and kept current in the background, the aggregation serves until then
+    admin_scores_view.start()
+    if admin_scores_view.is_ready:
+        return admin_scores_view.ranking()
+
+    return await aggregate_admin_scores()
+
+
+async def aggregate_admin_scores():
+    found_documents = admin_scores_collection.aggregate(ADMIN_SCORES_PIPELINE)
     try:
         return await asyncio.wait_for(found_documents.to_list(length=None), __CONNECT_TIMEOUT)
     except asyncio.exceptions.TimeoutError:
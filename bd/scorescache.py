@@ -0,0 +1,109 @@
+import re
+
+import aiohttp
+
+from utils.indexedcache import IndexedCache
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class ScoresCache(IndexedCache):
+    def __init__(self, url: str, get_session, ttl: float = 10.0, id_field: str = 'id',
+                 failure_ttl: float = 2.0) -> None:
+        super().__init__(self.__fetch, ttl=ttl, id_field=id_field, failure_ttl=failure_ttl, name='ScoresCache')
+        self.__url = url
+        self.__get_session = get_session
+        self.__ttl = ttl
+        self.__etag = None
+
+    def __ttl_from(self, resp: aiohttp.ClientResponse) -> float:
+        match = _MAX_AGE.search(resp.headers.get('Cache-Control', ''))
+        return min(self.__ttl, float(match.group(1))) if match is not None else self.__ttl
+
+    async def __fetch(self) -> tuple:
+        headers = {'If-None-Match': self.__etag} if self.__etag is not None else {}
+        session: aiohttp.ClientSession = await self.__get_session()
+        async with session.get(self.__url, headers=headers) as resp:
+            if resp.status == 304:
+                return None, self.__ttl_from(resp)
+
+            resp.raise_for_status()
+            scores = await resp.json(encoding='utf-8')
+            self.__etag = resp.headers.get('ETag')
+            return scores, self.__ttl_from(resp)
+
+
+if __name__ == '__main__':
+    import asyncio
+    import hashlib
+    import json
+    import random
+    import string
+    import time
+
+    from aiohttp import web
+
+    NUMBER_OF_IDS = 676
+    REQUESTS = 200
+
+    random.seed(0)
+    scores = [{'id': ''.join(random.choices(string.ascii_uppercase, k=70)),
+               'score': random.randrange(10000),
+               'timestamp': 1660000000 + i} for i in range(NUMBER_OF_IDS)]
+    body = json.dumps(scores).encode('utf-8')
+    etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+    served = {'full': 0, 'not_modified': 0}
+
+    # Stand-in for the scores endpoint
+    async def handle_scores(request: web.Request):
+        if request.headers.get('If-None-Match') == etag:
+            served['not_modified'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+
+        served['full'] += 1
+        return web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get('/scores/', handle_scores)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        url = f'http://127.0.0.1:{port}/scores/'
+        ids = [score['id'] for score in scores]
+
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url) as resp:
+                    found = await resp.json(encoding='utf-8')
+            user_id = random.choice(ids)
+            next(score for score in found if score['id'] == user_id)
+        uncached = time.perf_counter() - started
+
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(keepalive_timeout=30))
+
+        async def get_session():
+            return session
+
+        for ttl in [0.0, 10.0]:
+            served['full'] = served['not_modified'] = 0
+            cache = ScoresCache(url, get_session, ttl=ttl)
+            started = time.perf_counter()
+            for _ in range(REQUESTS):
+                await cache.get_by_id(random.choice(ids))
+            elapsed = time.perf_counter() - started
+            print(f'cached ttl={ttl}: {elapsed / REQUESTS * 1000:.3f} ms/lookup {cache.metrics} served {served}')
+
+        served['full'] = served['not_modified'] = 0
+        cache = ScoresCache(url, get_session, ttl=10.0)
+        await asyncio.gather(*[cache.get_by_id(random.choice(ids)) for _ in range(REQUESTS)])
+        print(f'{REQUESTS} concurrent lookups: {cache.metrics} served {served}')
+
+        print(f'new session + scan: {uncached / REQUESTS * 1000:.3f} ms/lookup')
+        await session.close()
+        await runner.cleanup()
+
+    asyncio.run(main())
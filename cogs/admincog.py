@@ -2,14 +2,14 @@ from email.message import Message
 import logging
 import os
 
-from bd.mongo import get_admin_scores
+from bd.mongo import get_admin_user_score, get_min_max_admin_scores
 from discord import Client
 from discord.ext import commands
 from discord.ext.commands import Context
 from pool.pool import pool
 from utils.qubicservicesutils import get_pretty_revenues, get_user_revenues
-from utils.utils import (admin_scores_pretty, get_user_score_from_admin, prepare_file_name,
-                         reply_data_as_file)
+from utils.resultcache import command_cache
+from utils.utils import prepare_file_name, reply_data_as_file
 
 from cogs.basecog import BaseCog
 
@@ -29,7 +29,7 @@ class AdminCog(BaseCog):
     @commands.command()
     async def qubic_admin(self, ctx: Context, *args):
         if len(args) > 0:
-            await pool.add_command(self.__admin, ctx, *args)
+            await self._add_command(ctx, self.__admin, *args, priority=pool.PRIORITY_ADMIN)
 
     async def __admin(self, ctx: Context, *args):
         user_id = ""
@@ -46,15 +46,12 @@ class AdminCog(BaseCog):
                 await self.__revenues(ctx, user_id)
 
     async def __admin_scores(self, ctx: Context, user_id: str = ""):
-        admin_scores = await get_admin_scores()
-
-        if len(admin_scores) <= 0:
-            await self._reply_missing_data(ctx)
-            return
-
         if user_id != "":
             try:
-                user_data = await get_user_score_from_admin(admin_scores, user_id)
+                user_data = await command_cache.get(('admin_scores', user_id), get_admin_user_score, user_id)
+                if user_data == None:
+                    raise ValueError(f"{user_id} is not found")
+
                 await self._reply(ctx, f"{user_data[0]}. {user_data[1]} - {user_data[2]}")
                 return
             except Exception as e:
@@ -62,6 +59,14 @@ class AdminCog(BaseCog):
                 await self._reply_missing_data(ctx)
                 return
 
+        # Without an id the command only reports missing data, the bounds are the cheapest check
+        try:
+            await command_cache.get(('admin_scores', 'bounds'), get_min_max_admin_scores)
+        except Exception as e:
+            logging.warning(e)
+            await self._reply_missing_data(ctx)
+            return
+
         # pretty_data = admin_scores_pretty(admin_scores)
         # if len(pretty_data) <= 0:
         #     await self._reply_missing_data(ctx)
@@ -1,8 +1,11 @@
+import logging
+from asyncio import QueueFull
 from datetime import datetime
 
 from discord import Client
 from discord.ext import commands
 from discord.ext.commands import Context
+from pool.pool import pool
 
 
 class BaseCog(commands.Cog):
@@ -25,3 +28,10 @@ class BaseCog(commands.Cog):
 
     async def _reply_missing_data(self, ctx: Context):
         await self._reply(ctx, "The data is missing")
+
+    async def _add_command(self, ctx: Context, func, *args, priority: int = pool.PRIORITY_PUBLIC):
+        try:
+            await pool.add_command(func, ctx, *args, priority=priority, user=ctx.author.id)
+        except QueueFull as e:
+            logging.warning(e)
+            await self._reply(ctx, "The bot is busy, try again later")
@@ -5,7 +5,7 @@ from bd.mongo import get_pretty_scores, get_pretty_user_score
 from discord import Client
 from discord.ext import commands
 from discord.ext.commands import Context
-from pool.pool import pool
+from utils.resultcache import command_cache
 from utils.utils import reply_data_as_file
 
 from cogs.basecog import BaseCog
@@ -18,7 +18,7 @@ class QubicCog(BaseCog):
 
     @commands.command()
     async def scores(self, ctx: Context, *args):
-        await pool.add_command(self.__scores, ctx, *args)
+        await self._add_command(ctx, self.__scores, *args)
 
     async def __scores(self, ctx: Context, *args):
         user_id = ""
@@ -28,7 +28,7 @@ class QubicCog(BaseCog):
         # User scores
         if user_id != "":
             try:
-                user_data = await get_pretty_user_score(user_id)
+                user_data = await command_cache.get(('scores', user_id), get_pretty_user_score, user_id)
             except Exception as e:
                 logging.warning(e)
                 await self._reply_missing_data(ctx)
@@ -0,0 +1,214 @@
+import json
+import logging
+import struct
+from collections import namedtuple
+
+from nats.aio.msg import Msg
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CODEC_HEADER = 'Content-Type'
+
+ArrayPayload = namedtuple('ArrayPayload', ['ids', 'counts', 'values'])
+
+_EMPTY_VALUE = 0xFFFFFFFF
+_ARRAY_HEADER = struct.Struct('<HHH')
+
+
+class Codec():
+    name: str = None
+    content_type: str = None
+
+    def decode(self, data: bytes):
+        raise NotImplementedError()
+
+    def encode(self, obj) -> bytes:
+        raise NotImplementedError()
+
+
+class JsonCodec(Codec):
+    name = 'json'
+    content_type = 'application/json'
+
+    def decode(self, data: bytes):
+        return json.loads(data)
+
+    def encode(self, obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+
+    def decode(self, data: bytes):
+        return orjson.loads(data)
+
+    def encode(self, obj) -> bytes:
+        return orjson.dumps(obj)
+
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    content_type = 'application/msgpack'
+
+    def decode(self, data: bytes):
+        return msgpack.unpackb(data, strict_map_key=False)
+
+    def encode(self, obj) -> bytes:
+        return msgpack.packb(obj)
+
+
+def _pack_ids(ids: list) -> tuple:
+    id_size = max((len(id) for id in ids), default=0)
+    return id_size, b''.join(id.encode('ascii').ljust(id_size, b'\0') for id in ids)
+
+
+def _unpack_ids(data: bytes, offset: int, rows: int, id_size: int) -> tuple:
+    end = offset + rows * id_size
+    if id_size <= 0:
+        return [str(row) for row in range(rows)], end
+
+    raw = data[offset:end]
+    return [raw[i:i + id_size].rstrip(b'\0').decode('ascii') for i in range(0, len(raw), id_size)], end
+
+
+class RevenuesArrayCodec(Codec):
+    """rows:u16 width:u16 id_size:u16 | ids | counts:u16[rows] | values:u32[rows * width]
+    """
+    name = 'revenues-array'
+    content_type = 'application/vnd.qubic.revenues'
+
+    def decode(self, data: bytes) -> ArrayPayload:
+        rows, width, id_size = _ARRAY_HEADER.unpack_from(data)
+        ids, offset = _unpack_ids(data, _ARRAY_HEADER.size, rows, id_size)
+        if np is None:
+            counts = list(struct.unpack_from(f'<{rows}H', data, offset))
+            offset += rows * 2
+            flat = struct.unpack_from(f'<{rows * width}I', data, offset)
+            values = [list(flat[row * width:row * width + counts[row]]) for row in range(rows)]
+            return ArrayPayload(ids, counts, values)
+
+        counts = np.frombuffer(data, dtype='<u2', count=rows, offset=offset).astype(np.int64)
+        offset += rows * 2
+        values = np.frombuffer(data, dtype='<u4', count=rows * width, offset=offset).reshape(rows, width)
+        return ArrayPayload(ids, counts, values)
+
+    def encode(self, obj: dict) -> bytes:
+        ids = list(obj.keys())
+        counts = [len(v) for v in obj.values()]
+        width = max(counts, default=0)
+        id_size, packed_ids = _pack_ids(ids)
+        values = []
+        for v_list in obj.values():
+            values.extend(v_list)
+            values.extend([_EMPTY_VALUE] * (width - len(v_list)))
+
+        return b''.join([_ARRAY_HEADER.pack(len(ids), width, id_size), packed_ids,
+                         struct.pack(f'<{len(counts)}H', *counts),
+                         struct.pack(f'<{len(values)}I', *values)])
+
+
+class TicksArrayCodec(Codec):
+    """rows:u16 width:u16 (unused) id_size:u16 | ids | ticks:u32[rows]
+    """
+    name = 'ticks-array'
+    content_type = 'application/vnd.qubic.ticks'
+
+    def decode(self, data: bytes) -> dict:
+        rows, _, id_size = _ARRAY_HEADER.unpack_from(data)
+        ids, offset = _unpack_ids(data, _ARRAY_HEADER.size, rows, id_size)
+        return dict(zip(ids, struct.unpack_from(f'<{rows}I', data, offset)))
+
+    def encode(self, obj: dict) -> bytes:
+        id_size, packed_ids = _pack_ids(list(obj.keys()))
+        return b''.join([_ARRAY_HEADER.pack(len(obj), 0, id_size), packed_ids,
+                         struct.pack(f'<{len(obj)}I', *obj.values())])
+
+
+_codecs = {JsonCodec.name: JsonCodec(),
+           RevenuesArrayCodec.name: RevenuesArrayCodec(),
+           TicksArrayCodec.name: TicksArrayCodec()}
+if orjson is not None:
+    _codecs[OrjsonCodec.name] = OrjsonCodec()
+if msgpack is not None:
+    _codecs[MsgpackCodec.name] = MsgpackCodec()
+
+_json_codec = _codecs.get(OrjsonCodec.name, _codecs[JsonCodec.name])
+
+_default_binary = {'revenues': RevenuesArrayCodec.name,
+                   'ticks': TicksArrayCodec.name}
+
+
+def available_codecs() -> list:
+    return list(_codecs.keys())
+
+
+def get_codec(name: str) -> Codec:
+    if name in (JsonCodec.name, OrjsonCodec.name):
+        return _json_codec
+
+    codec = _codecs.get(name)
+    if codec is None:
+        logging.warning(f'Codec {name} is not available, falling back to {_json_codec.name}')
+        return _json_codec
+
+    return codec
+
+
+def get_codec_by_content_type(content_type: str) -> Codec:
+    for codec in _codecs.values():
+        if codec.content_type == content_type:
+            return get_codec(codec.name)
+
+    logging.warning(f'Unknown content type {content_type}, falling back to {_json_codec.name}')
+    return _json_codec
+
+
+def negotiate(msg: Msg) -> Codec:
+    # Only the Content-Type header selects the codec. Data is published on the bare subject, the subjects
+    # below it (.delta, .snapshot, .keyframe) carry other messages and are never parsed as a codec hint
+    headers = msg.headers if msg.headers is not None else dict()
+    content_type = headers.get(CODEC_HEADER)
+    if content_type is not None:
+        return get_codec_by_content_type(content_type)
+
+    return _json_codec
+
+
+if __name__ == '__main__':
+    import random
+    import timeit
+
+    NUMBER_OF_COMPUTORS = 676
+    QUORUM = int((NUMBER_OF_COMPUTORS * 2 / 3) + 1)
+
+    random.seed(0)
+    ids = [''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=70)) for _ in range(NUMBER_OF_COMPUTORS)]
+    payloads = {
+        'ticks': {str(i): random.randrange(1000000, 1000010) for i in range(NUMBER_OF_COMPUTORS)},
+        'scores': {id: {'s': random.randrange(10000), 'r': random.randrange(10000), 't': 1660000000.5} for id in ids},
+        'revenues': {id: [random.randrange(1479289940) for _ in range(random.choice([NUMBER_OF_COMPUTORS, QUORUM]))]
+                     for id in ids},
+    }
+
+    number = 20
+    for subject, payload in payloads.items():
+        names = [name for name in _codecs if not name.endswith('-array') or name == _default_binary.get(subject)]
+        for name in names:
+            codec = _codecs[name]
+            data = codec.encode(payload)
+            elapsed = timeit.timeit(lambda: codec.decode(data), number=number) / number
+            print(f'{subject:<9} {name:<15} {len(data):>9} bytes {elapsed * 1000:>8.2f} ms')
@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import os
+import time
 from typing import Optional
 from nats.aio.client import Client
 import nats.errors
@@ -20,13 +21,33 @@ class Nats():
 
             nats_host = os.getenv("NATS_HOST", 'localhost')
             nats_port = os.getenv("NATS_PORT", '4222')
+            nats_servers = os.getenv("NATS_SERVERS", '')
 
             cls.__instance = super(Nats, cls).__new__(cls)
 
             cls.__nc: Optional[Client] = None
             cls.__host = nats_host
             cls.__port = nats_port
+            cls.__servers = [server.strip() for server in nats_servers.split(',') if server.strip() != '']
+            if len(cls.__servers) <= 0:
+                cls.__servers = [f'nats://{nats_host}:{nats_port}']
             cls.__token = str(os.getenv('NATS_TOKEN', ''))
+            cls.__options = {
+                'connect_timeout': float(os.getenv('NATS_CONNECT_TIMEOUT', 2)),
+                'reconnect_time_wait': float(os.getenv('NATS_RECONNECT_WAIT', 2)),
+                'max_reconnect_attempts': int(os.getenv('NATS_MAX_RECONNECT_ATTEMPTS', 60)),
+                'ping_interval': float(os.getenv('NATS_PING_INTERVAL', 20)),
+                'max_outstanding_pings': int(os.getenv('NATS_MAX_OUTSTANDING_PINGS', 2)),
+                'pending_size': int(os.getenv('NATS_PENDING_SIZE', 2 * 1024 * 1024)),
+                'flush_timeout': float(os.getenv('NATS_FLUSH_TIMEOUT', 5)),
+                'dont_randomize': os.getenv('NATS_DONT_RANDOMIZE', '0') == '1',
+            }
+            cls.__connect_lock: Optional[asyncio.Lock] = None
+            cls.__rtt_task: Optional[asyncio.Task] = None
+            cls.__rtt_interval = float(os.getenv('NATS_RTT_INTERVAL', 10))
+            cls.__rtt_warning = float(os.getenv('NATS_RTT_WARNING', 0.25))
+            cls.__metrics = {'rtt': None, 'rtt_avg': None, 'rtt_max': None, 'rtt_failures': 0,
+                             'disconnects': 0, 'reconnects': 0, 'errors': 0}
 
         return cls.__instance
 
@@ -58,7 +79,80 @@ class Nats():
     def max_payload(self):
         return self.nc.max_payload
 
+    @property
+    def servers(self) -> list:
+        return list(self.__servers)
+
+    @property
+    def connected_url(self):
+        if self.nc is None or self.nc.connected_url is None:
+            return None
+
+        return self.nc.connected_url.netloc
+
+    @property
+    def metrics(self) -> dict:
+        metrics = dict(self.__metrics)
+        metrics['connected_url'] = self.connected_url
+        return metrics
+
+    async def __error_cb(self, e: Exception):
+        self.__metrics['errors'] += 1
+        logging.warning(f'Nats: {type(e).__name__}: {e}')
+
+    async def __disconnected_cb(self):
+        self.__metrics['disconnects'] += 1
+        logging.warning('Nats: disconnected')
+
+    async def __reconnected_cb(self):
+        self.__metrics['reconnects'] += 1
+        logging.info(f'Nats: reconnected to {self.connected_url}')
+
+    async def measure_rtt(self, timeout: float = None) -> float | None:
+        if self.is_disconected or not self.is_connected:
+            return None
+
+        timeout = timeout if timeout is not None else self.__options['flush_timeout']
+        start = time.perf_counter()
+        try:
+            await self.nc.flush(timeout=timeout)
+        except asyncio.CancelledError as e:
+            raise e
+        except (nats.errors.Error, asyncio.TimeoutError) as e:
+            self.__metrics['rtt_failures'] += 1
+            logging.warning(f'Nats: RTT measurement failed: {type(e).__name__}')
+            return None
+
+        rtt = time.perf_counter() - start
+        avg = self.__metrics['rtt_avg']
+        self.__metrics['rtt'] = rtt
+        self.__metrics['rtt_avg'] = rtt if avg is None else avg * 0.8 + rtt * 0.2
+        self.__metrics['rtt_max'] = max(rtt, self.__metrics['rtt_max'] or 0)
+        if rtt > self.__rtt_warning:
+            logging.warning(f'Nats: RTT to {self.connected_url} is {rtt * 1000:.1f} ms')
+
+        return rtt
+
+    async def __rtt_loop(self):
+        while True:
+            await asyncio.sleep(self.__rtt_interval)
+            await self.measure_rtt()
+
+    def __start_rtt_monitor(self):
+        if self.__rtt_interval <= 0:
+            return
+
+        if self.__rtt_task is None or self.__rtt_task.done():
+            self.__rtt_task = asyncio.create_task(self.__rtt_loop())
+
     async def connect(self):
+        if self.__connect_lock is None:
+            self.__connect_lock = asyncio.Lock()
+
+        async with self.__connect_lock:
+            return await self.__connect()
+
+    async def __connect(self):
         import nats
         from nats import errors
         from asyncio import TimeoutError
@@ -67,11 +161,17 @@ class Nats():
             return self.__nc
 
         try:
-            self.__nc = await nats.connect(servers=[f'nats://{self.__host}:{self.__port}'], token=self.__token)
+            self.__nc = await nats.connect(servers=self.__servers, token=self.__token,
+                                           error_cb=self.__error_cb,
+                                           disconnected_cb=self.__disconnected_cb,
+                                           reconnected_cb=self.__reconnected_cb,
+                                           **self.__options)
         except (OSError, errors.Error, TimeoutError, errors.NoServersError) as e:
-            logging.error(e)
+            logging.error(f'Nats: failed to connect to {self.__servers}: {e}')
             return None
 
+        logging.info(f'Nats: connected to {self.connected_url}')
+        self.__start_rtt_monitor()
         return self.__nc
 
     async def close(self):
@@ -88,18 +188,55 @@ class Nats():
         await self.__nc.drain()
         self.__nc = None
 
-    async def subscribe(self, subject: str):
+    async def subscribe(self, subject: str, **kwargs):
         if self.is_disconected:
             return None
 
         try:
-            return await self.nc.subscribe(subject=subject)
+            return await self.nc.subscribe(subject=subject, **kwargs)
         except asyncio.CancelledError as e:
             raise e
         except nats.errors.Error as e:
             logging.exception(e)
             return None
 
+    async def request(self, subject: str, payload: bytes = b'', timeout: float = 1.0):
+        if self.is_disconected:
+            return None
+
+        try:
+            return await self.nc.request(subject, payload, timeout=timeout)
+        except asyncio.CancelledError as e:
+            raise e
+        except (nats.errors.Error, asyncio.TimeoutError) as e:
+            logging.warning(f'Request to {subject} failed: {type(e).__name__}')
+            return None
+
+    async def get_last_msg(self, subject: str, stream: Optional[str] = None, timeout: float = 1.0):
+        import base64
+        from nats.aio.msg import Msg
+
+        if self.is_disconected:
+            return None
+
+        try:
+            js = self.nc.jetstream(timeout=timeout)
+            if stream is None:
+                stream = await js.find_stream_name_by_subject(subject)
+
+            raw_msg = await js.get_last_msg(stream, subject)
+        except asyncio.CancelledError as e:
+            raise e
+        except (nats.errors.Error, asyncio.TimeoutError, KeyError, IndexError) as e:
+            logging.warning(f'Failed to get the last message of {subject}: {type(e).__name__}')
+            return None
+
+        data = raw_msg.data
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+
+        return Msg(_client=self.nc, subject=raw_msg.subject or subject, data=data or b'', headers=raw_msg.headers)
+
     async def publish(self, subject: str, payload: bytes):
         if self.is_disconected:
             return None
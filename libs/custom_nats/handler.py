@@ -1,5 +1,9 @@
 import asyncio
 import logging
+import random
+import time
+from collections import deque
+from enum import Enum
 from typing import Optional
 
 from nats.aio.msg import Msg
@@ -8,11 +12,28 @@ from nats.aio.subscription import Subscription
 from custom_nats.custom_nats import Nats
 
 
+class HandlerState(Enum):
+    NONE = 0
+    UP = 1
+    RETRYING = 2
+    STOPPED = 3
+
+
 class Handler():
+    coalesce: bool = False
+    pending_msgs_limit: int = 0
+    bootstrap: bool = False
+
     def __init__(self, nc: Nats) -> None:
         self._nc = nc
         self._sub: Optional[Subscription] = None
+        self._buffer: Optional[deque] = None
+        self._buffered = asyncio.Event()
         self._background_tasks = set()
+        self._received = 0
+        self._superseded = 0
+        self._state = HandlerState.NONE
+        self._last_msg_time: Optional[float] = None
 
     def add_task(self, task: asyncio.Task):
         try:
@@ -57,12 +78,17 @@ class Handler():
             logging.exception(TypeError(f'Subscription must be of the {Subscription.__name__} type'))
 
         self._sub = sub
+        self._state = HandlerState.UP
+        if self.bootstrap:
+            await self._bootstrap()
+
         try:
             while not sub._closed and not self._nc.is_disconected:
                 msg = await self._wait_msg(sub)
                 if msg is None:
                     continue
 
+                self._last_msg_time = time.monotonic()
                 await self._handler_msg(msg)
         except Exception as e:
             logging.exception(e)
@@ -75,7 +101,10 @@ class Handler():
         task = asyncio.create_task(asyncio.sleep(0))
 
         if self._sub is not None and not self._sub._closed:
-            await self._sub.unsubscribe()
+            try:
+                await self._sub.unsubscribe()
+            except Exception as e:
+                self._warning(f'failed to unsubscribe: {type(e).__name__}')
 
         if not task.done():
             await asyncio.wait({task})
@@ -83,6 +112,86 @@ class Handler():
     async def get_sub(self) -> Subscription | None:
         return None
 
+    async def get_snapshot(self) -> Msg | None:
+        return None
+
+    async def _bootstrap(self):
+        try:
+            msg = await self.get_snapshot()
+            if msg is None or len(msg.data) <= 0:
+                self._info('no snapshot to bootstrap from')
+                return
+
+            self._info('bootstrapping from a snapshot')
+            await self._handler_msg(msg)
+        except asyncio.CancelledError as e:
+            raise e
+        except Exception as e:
+            logging.exception(e)
+
+    async def _subscribe(self, subject: str) -> Subscription | None:
+        if not self.coalesce and self.pending_msgs_limit <= 0:
+            self._buffer = None
+            return await self._nc.subscribe(subject)
+
+        # A full client queue drops the newest message, the local buffer evicts the oldest one instead
+        self._buffer = deque(maxlen=self.pending_msgs_limit if self.pending_msgs_limit > 0 else None)
+        self._buffered.clear()
+        return await self._nc.subscribe(subject, cb=self._on_msg)
+
+    async def _on_msg(self, msg: Msg):
+        if self._buffer.maxlen is not None and len(self._buffer) >= self._buffer.maxlen:
+            self._received += 1
+            self._superseded += 1
+        self._buffer.append(msg)
+        self._buffered.set()
+
+    @property
+    def state(self) -> HandlerState:
+        return self._state
+
+    @state.setter
+    def state(self, state: HandlerState):
+        self._state = state
+
+    @property
+    def last_msg_age(self) -> float | None:
+        if self._last_msg_time is None:
+            return None
+
+        return time.monotonic() - self._last_msg_time
+
+    @property
+    def received(self) -> int:
+        return self._received
+
+    @property
+    def superseded(self) -> int:
+        return self._superseded
+
+    def _take_latest(self, msg: Msg) -> Msg:
+        skipped = len(self._buffer)
+        if skipped > 0:
+            msg = self._buffer[-1]
+            self._buffer.clear()
+            self._received += skipped
+            self._superseded += skipped
+            self._debug(f'{skipped} messages superseded ({self._superseded} in total)')
+
+        return msg
+
+    async def _next_buffered(self, timeout: float) -> Msg | None:
+        from asyncio import TimeoutError
+
+        if len(self._buffer) <= 0:
+            self._buffered.clear()
+            try:
+                await asyncio.wait_for(self._buffered.wait(), timeout)
+            except TimeoutError:
+                return None
+
+        return self._buffer.popleft()
+
     async def _wait_msg(self, sub: Subscription) -> Msg | None:
         from asyncio import TimeoutError
 
@@ -91,11 +200,20 @@ class Handler():
 
         try:
             self._debug('waiting a message')
-            msg = await sub.next_msg()
+            if self._buffer is not None:
+                msg = await self._next_buffered(1.0)
+                if msg is None:
+                    return None
+            else:
+                msg = await sub.next_msg()
             self._debug('message received')
         except TimeoutError as e:
             return None
 
+        self._received += 1
+        if self.coalesce:
+            msg = self._take_latest(msg)
+
         return msg
 
     async def _handler_msg(self, msg: Msg):
@@ -124,3 +242,62 @@ class HandlerStarter():
             handler, Handler), f"{HandlerStarter.__name__} should only work with the {Handler.__name__} class"
         async with HandlerWrapper(handler) as h:
             await h.loop()
+
+    @staticmethod
+    async def supervise(handler: Handler, min_delay: float = 1.0, max_delay: float = 60.0):
+        await HandlerSupervisor(handler, min_delay, max_delay).run()
+
+
+class HandlerSupervisor():
+    def __init__(self, handler: Handler, min_delay: float = 1.0, max_delay: float = 60.0) -> None:
+        assert isinstance(
+            handler, Handler), f"{HandlerSupervisor.__name__} should only work with the {Handler.__name__} class"
+        self.__handler = handler
+        self.__min_delay = min_delay
+        self.__max_delay = max_delay
+        self.__restarts = 0
+
+    @property
+    def handler(self) -> Handler:
+        return self.__handler
+
+    @property
+    def restarts(self) -> int:
+        return self.__restarts
+
+    def status(self) -> dict:
+        age = self.__handler.last_msg_age
+        return {'state': self.__handler.state.name,
+                'restarts': self.__restarts,
+                'received': self.__handler.received,
+                'superseded': self.__handler.superseded,
+                'last_msg_age': None if age is None else round(age, 1)}
+
+    def __delay(self, attempt: int) -> float:
+        delay = min(self.__max_delay, self.__min_delay * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    async def run(self):
+        name = type(self.__handler).__name__
+        attempt = 0
+        try:
+            while True:
+                nc = self.__handler._nc
+                if nc.is_closed:
+                    await nc.connect()
+
+                started = time.monotonic()
+                async with HandlerWrapper(self.__handler) as h:
+                    await h.loop()
+
+                if time.monotonic() - started > self.__max_delay:
+                    attempt = 0
+
+                delay = self.__delay(attempt)
+                attempt += 1
+                self.__restarts += 1
+                self.__handler.state = HandlerState.RETRYING
+                logging.warning(f'{HandlerSupervisor.__name__}: {name} stopped, restarting in {delay:.1f} s')
+                await asyncio.sleep(delay)
+        finally:
+            self.__handler.state = HandlerState.STOPPED
@@ -52,6 +52,15 @@ class DataSubjects:
     REVENUES = 'qubic.data.revenues'
     EPOCH = 'qubic.data.epoch'
 
+    SCORES_DELTA = 'qubic.data.scores.delta'
+    REVENUES_DELTA = 'qubic.data.revenues.delta'
+    SCORES_KEYFRAME = 'qubic.data.scores.keyframe'
+    REVENUES_KEYFRAME = 'qubic.data.revenues.keyframe'
+
+
+class DataHeaders:
+    SEQUENCE = 'Qubic-Seq'
+
 
 """Network packages
 """
@@ -9,5 +9,8 @@ setup(
         'python-dotenv',
         'aiofiles'
     ],
+    extras_require={
+        'codecs': ['orjson', 'msgpack', 'numpy']
+    },
     package_data={'qubic_verify':['linux/*.so', 'win64/*.dll', 'win64/*.exp', 'win64/*.lib']}
 )
\ No newline at end of file
@@ -1,56 +1,170 @@
 
 import asyncio
 import logging
-from asyncio import Queue, Task
+import os
+import time
+from asyncio import QueueFull, Task
+from collections import deque
+from dataclasses import dataclass, field
 from inspect import iscoroutinefunction
-from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+@dataclass
+class _Command:
+    func: object
+    args: tuple
+    kwargs: dict
+    priority: int
+    user: object
+    timeout: float
+    enqueued: float = field(default_factory=time.monotonic)
 
 
 class Pool():
-    def __init__(self) -> None:
-        self.pool = Queue()
-        self._task: Optional[Task] = None
+    PRIORITY_ADMIN = 0
+    PRIORITY_PUBLIC = 1
+
+    def __init__(self, workers: int = None, max_queue: int = None, max_per_user: int = None,
+                 timeout: float = None) -> None:
+        self.__workers = workers if workers is not None else int(os.getenv('POOL_WORKERS', 4))
+        self.__max_queue = max_queue if max_queue is not None else int(os.getenv('POOL_MAX_QUEUE', 100))
+        self.__max_per_user = max_per_user if max_per_user is not None else int(
+            os.getenv('POOL_MAX_PER_USER', 3))
+        self.__timeout = timeout if timeout is not None else float(os.getenv('POOL_COMMAND_TIMEOUT', 30))
+
+        # priority -> user -> commands, users are served round-robin inside a priority
+        self.__queues = dict()
+        self.__rotations = dict()
+        self.__queued = 0
+        self.__available = asyncio.Semaphore(0)
+        self.__running = 0
+        self.__idle = asyncio.Event()
+        self.__idle.set()
+        self._tasks: list[Task] = []
+        self.__metrics = {'submitted': 0, 'executed': 0, 'rejected': 0, 'failed': 0, 'timed_out': 0,
+                          'wait_total': 0.0, 'wait_max': 0.0, 'run_total': 0.0, 'run_max': 0.0}
+
+    async def add_command(self, func, *args, priority: int = PRIORITY_PUBLIC, user=None,
+                          timeout: float = None, **kwargs):
+        if self.__queued >= self.__max_queue:
+            self.__metrics['rejected'] += 1
+            raise QueueFull(f'Pool queue is full ({self.__max_queue})')
+
+        users = self.__queues.setdefault(priority, dict())
+        commands: deque = users.get(user)
+        if commands is not None and user is not None and len(commands) >= self.__max_per_user:
+            self.__metrics['rejected'] += 1
+            raise QueueFull(f'Pool queue of {user} is full ({self.__max_per_user})')
+
+        if commands is None:
+            commands = deque()
+            users[user] = commands
+            self.__rotations.setdefault(priority, deque()).append(user)
+
+        commands.append(_Command(func=func, args=args, kwargs=kwargs, priority=priority, user=user,
+                                 timeout=timeout if timeout is not None else self.__timeout))
+        self.__queued += 1
+        self.__metrics['submitted'] += 1
+        self.__idle.clear()
+        self.__available.release()
 
-    async def add_command(self, func, *args, **kwargs):
+    def __next_command(self) -> _Command:
+        for priority in sorted(self.__queues.keys()):
+            rotation: deque = self.__rotations.get(priority)
+            if not rotation:
+                continue
 
-        if self.pool.full():
-            await self.pool.put((func, args, kwargs))
-        else:
-            self.pool.put_nowait((func, args, kwargs))
+            users = self.__queues[priority]
+            user = rotation.popleft()
+            commands: deque = users[user]
+            command = commands.popleft()
+            if len(commands) > 0:
+                rotation.append(user)
+            else:
+                del users[user]
+
+            self.__queued -= 1
+            return command
+
+        return None
+
+    async def __run_command(self, command: _Command):
+        wait = time.monotonic() - command.enqueued
+        self.__metrics['wait_total'] += wait
+        self.__metrics['wait_max'] = max(self.__metrics['wait_max'], wait)
+
+        started = time.monotonic()
+        try:
+            if iscoroutinefunction(command.func):
+                await asyncio.wait_for(command.func(*command.args, **command.kwargs), command.timeout)
+            else:
+                command.func(*command.args, **command.kwargs)
+        except asyncio.TimeoutError:
+            self.__metrics['timed_out'] += 1
+            logging.warning(f'Pool: {getattr(command.func, "__name__", command.func)} timed out '
+                            f'after {command.timeout}s')
+        except Exception as e:
+            self.__metrics['failed'] += 1
+            logging.error(e)
+
+        elapsed = time.monotonic() - started
+        self.__metrics['executed'] += 1
+        self.__metrics['run_total'] += elapsed
+        self.__metrics['run_max'] = max(self.__metrics['run_max'], elapsed)
 
     async def execute(self):
         while True:
+            await self.__available.acquire()
+            command = self.__next_command()
+            if command is None:
+                continue
+
+            self.__running += 1
             try:
-                func_tuple = await self.pool.get()
-                func = func_tuple[0]
-                args = func_tuple[1]
-                kwargs = func_tuple[2]
+                await self.__run_command(command)
+            finally:
+                self.__running -= 1
+                if self.__queued <= 0 and self.__running <= 0:
+                    self.__idle.set()
 
-                if iscoroutinefunction(func):
-                    await func(*args, **kwargs)
-                else:
-                    func(*args, **kwargs)
+    def __len__(self):
+        return self.__queued
 
-            except Exception as e:
-                logging.error(e)
+    @property
+    def metrics(self) -> dict:
+        metrics = dict(self.__metrics)
+        wait_total = metrics.pop('wait_total')
+        run_total = metrics.pop('run_total')
+        metrics['wait_avg'] = wait_total / metrics['executed'] if metrics['executed'] > 0 else 0.0
+        metrics['run_avg'] = run_total / metrics['executed'] if metrics['executed'] > 0 else 0.0
+        metrics['queued'] = self.__queued
+        metrics['running'] = self.__running
+        return metrics
 
-            try:
-                self.pool.task_done()
-            except ValueError:
-                pass
+    def log_metrics(self):
+        logging.info(f'Pool: {self.metrics}')
 
-    def __len__(self):
-        return self.pool.qsize()
+    async def __log_metrics_loop(self):
+        stats_interval = float(os.getenv('POOL_STATS_INTERVAL', 300))
+        while True:
+            await asyncio.sleep(stats_interval)
+            self.log_metrics()
 
     def start(self):
         loop = asyncio.get_event_loop()
-        self._task = loop.create_task(self.execute())
+        self._tasks = [loop.create_task(self.execute()) for _ in range(max(1, self.__workers))]
+        self._tasks.append(loop.create_task(self.__log_metrics_loop()))
 
     async def stop(self):
-        await self.pool.join()
+        await self.__idle.wait()
 
-        if self._task != None:
-            self._task.cancel()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
 
 
 pool = Pool()
@@ -1,110 +1,233 @@
 import asyncio
 from dataclasses import dataclass
-import json
+from functools import partial
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from io import BytesIO
 from typing import Optional
 
+from custom_nats.codec import ArrayPayload, Codec, negotiate
 from custom_nats.custom_nats import Nats
-from custom_nats.handler import Handler, HandlerStarter
-from discord import Attachment, Client, Embed, File, Message
+from custom_nats.handler import Handler, HandlerSupervisor
+from discord import Client, Embed, RawMessageDeleteEvent
 from dotenv import load_dotenv
 from nats.aio.msg import Msg
-from qubic.qubicdata import DataSubjects, QUORUM, MAX_REVENUE_VALUE
-
+from qubic.qubicdata import DataHeaders, DataSubjects, MAX_REVENUE_VALUE
+
+from utils.attachments import prepare_attachments
+from utils.channeltarget import ChannelTarget
+from utils.dispatcher import Dispatcher
+from utils.historyindex import HistoryIndex
+from utils.messageregistry import MessageRegistry
+from utils.rendercache import RenderCache
+from utils.resultcache import command_cache
+from utils.revenues import RevenueTable
+from utils.scheduler import ViewSchedule, ViewScheduler
+from utils.scoreranking import ScoreRanking
+from utils.statestore import Snapshot, StateStore
+from utils.tickhistogram import TickHistogram
 from utils.utils import prepare_file_name
 
-_ticks = dict()
-_scores = dict()
-_revenues = dict()
-_epoch: int = None
-_last_epoch: int = _epoch
-
+# The handler settings below are class attributes, read on import
+load_dotenv()
+
+_decode_executor = ThreadPoolExecutor(max_workers=int(os.getenv('DECODE_WORKERS', 2)),
+                                      thread_name_prefix='decode')
+
+
+class DataHandler(Handler):
+    subject: str = None
+    coalesce = True
+    bootstrap = os.getenv('DATA_BOOTSTRAP', 'request') != 'none'
+    bootstrap_mode = os.getenv('DATA_BOOTSTRAP', 'request')
+    bootstrap_stream = os.getenv('DATA_BOOTSTRAP_STREAM', None)
+    bootstrap_timeout = float(os.getenv('DATA_BOOTSTRAP_TIMEOUT', 1))
+    pending_msgs_limit = int(os.getenv('DATA_PENDING_MSGS_LIMIT', 64))
+    offload_threshold = int(os.getenv('DECODE_OFFLOAD_THRESHOLD', 64 * 1024))
+    reorder_window = int(os.getenv('SEQUENCE_REORDER_WINDOW', 4))
+    max_stale = int(os.getenv('SEQUENCE_MAX_STALE', 3))
+
+    def __init__(self, nc: Nats, store: StateStore) -> None:
+        super().__init__(nc)
+        self._store = store
+        self._stale = 0
+
+    def _is_stale(self, kind: str, sequence: int | None, last_sequence: int | None) -> bool:
+        if sequence is None or last_sequence is None or sequence > last_sequence:
+            self._stale = 0
+            return False
+
+        # Only a message that arrived slightly out of order is stale. Far below the current sequence,
+        # or several in a row, means the publisher restarted and its counter started over
+        self._stale += 1
+        if last_sequence - sequence <= self.reorder_window and self._stale < self.max_stale:
+            self._warning(f'Skipping the stale {kind} {sequence}, {last_sequence} is already applied')
+            return True
+
+        self._warning(f'Got the {kind} {sequence} after {last_sequence}, assuming the publisher restarted')
+        self._stale = 0
+        return False
 
-class HandlerTick(Handler):
     async def get_sub(self):
         if self._nc.is_disconected:
             return None
 
-        return await self._nc.subscribe(DataSubjects.TICKS)
+        return await self._subscribe(self.subject)
 
-    async def _handler_msg(self, msg: Msg):
-        if msg is None or len(msg.data) <= 0:
-            return
+    async def get_snapshot(self):
+        if self.bootstrap_mode == 'jetstream':
+            return await self._nc.get_last_msg(self.subject, self.bootstrap_stream, self.bootstrap_timeout)
 
-        try:
-            logging.info('Got the tics')
-            global _ticks
-            _ticks = json.loads(msg.data)
-            # logging.info(_ticks)
-        except Exception as e:
-            logging.exception(e)
-            return
+        return await self._nc.request(f'{self.subject}.snapshot', timeout=self.bootstrap_timeout)
 
+    def _decode(self, codec: Codec, data: bytes):
+        return codec.decode(data)
 
-class HandlerScores(Handler):
-    async def get_sub(self):
-        if self._nc.is_disconected:
+    async def _decode_msg(self, msg: Msg):
+        codec = negotiate(msg)
+        data = msg.data
+        start = time.perf_counter()
+        offloaded = len(data) >= self.offload_threshold
+        if offloaded:
+            result = await asyncio.get_running_loop().run_in_executor(_decode_executor, self._decode, codec, data)
+        else:
+            result = self._decode(codec, data)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self._info(f'Got the {self.subject}: {len(data)} bytes of {codec.name} decoded in {elapsed:.1f} ms'
+                   + (' (offloaded)' if offloaded else ''))
+        return result
+
+    @staticmethod
+    def _sequence(msg: Msg) -> int | None:
+        if msg.headers is None:
             return None
 
-        return await self._nc.subscribe(DataSubjects.SCORES)
+        try:
+            return int(msg.headers[DataHeaders.SEQUENCE])
+        except (KeyError, ValueError):
+            return None
+
+    async def _publish(self, data, received: float, sequence: int | None):
+        snapshot: Snapshot = self._store.get(self.subject)
+        last_sequence = None if snapshot is None else snapshot.sequence
+        # A late keyframe would roll back deltas already applied on top of a newer one
+        if self._is_stale('keyframe', sequence, last_sequence):
+            return
+
+        self._store.publish(self.subject, data, received, sequence)
 
     async def _handler_msg(self, msg: Msg):
         if msg is None or len(msg.data) <= 0:
             return
 
+        received = time.time()
         try:
-            logging.info('Got the scores')
-            global _scores
-            _scores = json.loads(msg.data)
-            logging.info(f'{_scores}')
+            data = await self._decode_msg(msg)
+        except asyncio.CancelledError as e:
+            raise e
         except Exception as e:
             logging.exception(e)
             return
 
+        await self._publish(data, received, self._sequence(msg))
 
-class HandlerRevenues(Handler):
-    async def get_sub(self):
-        if self._nc.is_disconected:
-            return None
 
-        return await self._nc.subscribe(DataSubjects.REVENUES)
+class DeltaHandler(DataHandler):
+    coalesce = False
+    bootstrap = False
+    pending_msgs_limit = 0
+    keyframe_subject: str = None
+    request_subject: str = None
+    request_interval = float(os.getenv('KEYFRAME_REQUEST_INTERVAL', 5))
 
-    async def _handler_msg(self, msg: Msg):
-        import zstandard
+    SET_FIELD = 'set'
+    DELETE_FIELD = 'del'
 
-        if msg is None or len(msg.data) <= 0:
+    def __init__(self, nc: Nats, store: StateStore) -> None:
+        super().__init__(nc, store)
+        self._last_request = 0.0
+
+    def _apply_delta(self, data, changes: dict, removed: list):
+        raise NotImplementedError()
+
+    async def _request_keyframe(self):
+        now = time.monotonic()
+        if now - self._last_request < self.request_interval:
             return
 
-        try:
-            logging.info('Got the revenues')
-            global _revenues
-            _revenues = json.loads(zstandard.decompress(msg.data))
-        except Exception as e:
-            logging.exception(e)
+        self._last_request = now
+        self._info(f'Requesting a keyframe on {self.request_subject}')
+        await self._nc.publish(self.request_subject, b'')
+
+    async def _publish(self, data, received: float, sequence: int | None):
+        snapshot: Snapshot = self._store.get(self.keyframe_subject)
+        last_sequence = None if snapshot is None else snapshot.sequence
+        if self._is_stale('delta', sequence, last_sequence):
             return
 
+        if sequence is None or last_sequence is None or sequence != last_sequence + 1:
+            self._warning(f'Sequence gap: got {sequence} after {last_sequence}')
+            await self._request_keyframe()
+            return
 
-class HandlerEpoch(Handler):
-    async def get_sub(self):
-        if self._nc.is_disconected:
-            return None
+        data = self._apply_delta(snapshot.data, data.get(DeltaHandler.SET_FIELD, dict()),
+                                 data.get(DeltaHandler.DELETE_FIELD, []))
+        self._store.publish(self.keyframe_subject, data, received, sequence)
 
-        return await self._nc.subscribe(DataSubjects.EPOCH)
 
-    async def _handler_msg(self, msg: Msg):
-        if msg is None or len(msg.data) <= 0:
-            return
+class HandlerTick(DataHandler):
+    subject = DataSubjects.TICKS
 
-        try:
-            logging.info('Got the epoch')
-            global _epoch
-            _epoch = json.loads(msg.data)
-        except Exception as e:
-            logging.exception(e)
-            return
+
+class HandlerScores(DataHandler):
+    subject = DataSubjects.SCORES
+
+
+class HandlerRevenues(DataHandler):
+    subject = DataSubjects.REVENUES
+
+    def __init__(self, nc: Nats, store: StateStore) -> None:
+        import zstandard
+
+        super().__init__(nc, store)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def _decode(self, codec: Codec, data: bytes):
+        payload = codec.decode(self._decompressor.decompress(data))
+        if isinstance(payload, ArrayPayload):
+            return RevenueTable(payload.ids, payload.values, payload.counts)
+
+        return RevenueTable.from_dict(payload)
+
+
+class HandlerEpoch(DataHandler):
+    subject = DataSubjects.EPOCH
+
+
+class HandlerScoresDelta(DeltaHandler):
+    subject = DataSubjects.SCORES_DELTA
+    keyframe_subject = DataSubjects.SCORES
+    request_subject = DataSubjects.SCORES_KEYFRAME
+
+    def _apply_delta(self, data, changes: dict, removed: list):
+        scores = dict(data)
+        for id in removed:
+            scores.pop(id, None)
+
+        scores.update(changes)
+        return scores
+
+
+class HandlerRevenuesDelta(DeltaHandler):
+    subject = DataSubjects.REVENUES_DELTA
+    keyframe_subject = DataSubjects.REVENUES
+    request_subject = DataSubjects.REVENUES_KEYFRAME
+
+    def _apply_delta(self, data: RevenueTable, changes: dict, removed: list):
+        return data.updated(changes, removed)
 
 
 class TimerCommands():
@@ -116,121 +239,188 @@ class TimerCommands():
         MINMAX = 'Scores'
         EPOCH = 'Epoch'
 
+    @dataclass
+    class ViewNames:
+        TICK = 'tick'
+        MINMAX = 'minmax'
+        EPOCH = 'epoch'
+        SCORES = 'scores'
+        REVENUES = 'revenues'
+
+    priorities = {ViewNames.TICK: 0,
+                  ViewNames.EPOCH: 1,
+                  ViewNames.MINMAX: 2,
+                  ViewNames.SCORES: 3,
+                  ViewNames.REVENUES: 4}
+
     def __init__(self, bot: Client, nc: Optional[Nats] = None) -> None:
         self.__bot: Client = bot
         load_dotenv()
-        self.__tick_channel = bot.get_channel(
-            int(os.getenv("STATS_CHANNEL_ID")))
-        if self.__tick_channel == None:
-            raise ValueError("__tick_channel cannot be None")
-
-        self.__background_tasks = []
-
-        self.__functions: list = [self.__send_epoch, self.__send_min_max, self.__send_tick,
-                                  self.__send_revenues, self.__send_scores]
-
-        self.__nc = nc
-        self.__minmax_message = None
-        self.__tick_message = None
-        self.__epoch_message = None
-
-    @staticmethod
-    def get_utc():
-        return datetime.utcnow().replace(microsecond=0)
-
-    async def __get_messages_startwith(self, startwith: str = "", limit: int = 200) -> list:
-        tick_messages = []
-        message: Message = None
-        async for message in self.__tick_channel.history(limit=limit):
-            embeds = message.embeds
-            if len(embeds) <= 0:
+        self.__channels = []
+        for channel_id in os.getenv('STATS_CHANNEL_IDS', os.getenv('STATS_CHANNEL_ID', '')).split(','):
+            if len(channel_id.strip()) <= 0:
                 continue
 
-            e: Embed = embeds[-1]
-            if message.author == self.__bot.user and e.title.find(startwith) != -1:
-                tick_messages.append(message)
-
-        return tick_messages
-
-    async def __get_last_epoch_message(self, limit: int = 200) -> Message:
-        messages = await self.__get_messages_startwith(startwith=TimerCommands.MessageTitles.EPOCH, limit=limit)
-        if len(messages) > 0:
-            return messages[0]
-
-        return None
-
-    async def __get_last_tick_message(self) -> Message:
-        messages = await self.__get_all_tick_message()
-        if len(messages) > 0:
-            return messages[0]
-        return None
+            channel = bot.get_channel(int(channel_id))
+            if channel == None:
+                logging.error(f'TimerCommands: channel {channel_id} is not available')
+                continue
 
-    async def __get_all_tick_message(self, limit: int = 200) -> list:
-        return await self.__get_messages_startwith(startwith=TimerCommands.MessageTitles.TICK, limit=limit)
+            self.__channels.append(channel)
 
-    async def __get_minmax_messages(self, limit: int = 200) -> list:
-        return await self.__get_messages_startwith(startwith=TimerCommands.MessageTitles.MINMAX, limit=limit)
+        if len(self.__channels) <= 0:
+            raise ValueError("stats channels cannot be empty")
 
-    async def __get_last_minmax_message(self) -> Message:
-        messages = await self.__get_minmax_messages()
-        if len(messages) > 0:
-            return messages[0]
-        return None
+        self.__background_tasks = []
+        self.__supervisors = []
+
+        self.__store = StateStore()
+        self.__ticks = TickHistogram()
+        self.__scores = ScoreRanking()
+        self.__rendered_versions = dict()
+
+        self.__scheduler = ViewScheduler()
+        # The old loop edited every view once per 30 s. Keeping that as the minimum interval holds the
+        # API budget, and a view that was quiet for longer still publishes right after its first change
+        views = [(TimerCommands.ViewNames.TICK, DataSubjects.TICKS, self.__send_tick,
+                  ViewSchedule(min_interval=30)),
+                 (TimerCommands.ViewNames.MINMAX, DataSubjects.SCORES, self.__send_min_max,
+                  ViewSchedule(min_interval=30)),
+                 (TimerCommands.ViewNames.EPOCH, DataSubjects.EPOCH, self.__send_epoch,
+                  ViewSchedule(min_interval=30)),
+                 (TimerCommands.ViewNames.SCORES, DataSubjects.SCORES, self.__send_scores,
+                  ViewSchedule(min_interval=30, debounce=1, deadline=5)),
+                 (TimerCommands.ViewNames.REVENUES, DataSubjects.REVENUES, self.__send_revenues,
+                  ViewSchedule(min_interval=30, debounce=1, deadline=5))]
+        for name, subject, send, schedule in views:
+            self.__scheduler.add_view(name, partial(self.__publish_view, name, subject, send),
+                                      self.__schedule_from_env(name, schedule))
+
+        self.__store.subscribe(DataSubjects.TICKS, self.__on_ticks)
+        self.__store.subscribe(DataSubjects.SCORES, self.__on_scores)
+        self.__store.subscribe(DataSubjects.REVENUES, lambda _: self.__scheduler.mark_dirty(
+            TimerCommands.ViewNames.REVENUES))
+        self.__store.subscribe(DataSubjects.EPOCH, lambda _: self.__scheduler.mark_dirty(
+            TimerCommands.ViewNames.EPOCH))
+
+        self.__history_writer = None
+        if os.getenv('SCORE_HISTORY', 'false').lower() == 'true':
+            from bd.mongo import history_writer
+
+            self.__history_writer = history_writer
+            for subject in [DataSubjects.SCORES, DataSubjects.TICKS, DataSubjects.EPOCH]:
+                self.__store.subscribe(subject, lambda snapshot: history_writer.add(
+                    snapshot.subject, snapshot.data, snapshot.received, snapshot.version))
 
-    async def __cleanup(self):
-        logging.debug("TimerCommands.__cleanup")
+        self.__nc = nc
+        # Routes are channels, so the concurrency bounds how many targets are written at once
+        self.__dispatcher = Dispatcher(rate=float(os.getenv('DISCORD_ROUTE_RATE', 1)),
+                                       capacity=float(os.getenv('DISCORD_ROUTE_BURST', 5)),
+                                       concurrency=int(os.getenv('DISCORD_FANOUT_CONCURRENCY', 4)))
+        data_path = os.getenv('DATA_FILES_PATH', './')
+        self.__targets = [ChannelTarget(bot, channel,
+                                        MessageRegistry(os.path.join(data_path, f'messages_{channel.id}.json'),
+                                                        fallback_path=os.path.join(data_path, 'messages.json')),
+                                        HistoryIndex(titles={TimerCommands.MessageTitles.TICK: TimerCommands.ViewNames.TICK,
+                                                             TimerCommands.MessageTitles.MINMAX: TimerCommands.ViewNames.MINMAX,
+                                                             TimerCommands.MessageTitles.EPOCH: TimerCommands.ViewNames.EPOCH},
+                                                     prefixes={TimerCommands.ViewNames.SCORES: TimerCommands.ViewNames.SCORES,
+                                                               TimerCommands.ViewNames.REVENUES: TimerCommands.ViewNames.REVENUES}),
+                                        self.__dispatcher, TimerCommands.priorities,
+                                        rate_limit_penalty=float(os.getenv('DISCORD_RATE_LIMIT_PENALTY', 5)),
+                                        failure_threshold=int(os.getenv('DISCORD_TARGET_FAILURE_THRESHOLD', 3)),
+                                        min_backoff=float(os.getenv('DISCORD_TARGET_MIN_BACKOFF', 30)),
+                                        max_backoff=float(os.getenv('DISCORD_TARGET_MAX_BACKOFF', 3600)))
+                          for channel in self.__channels]
 
-        def is_me(message: Message):
-            return True or message.author == self.__bot.user
+    @staticmethod
+    def __schedule_from_env(name: str, default: ViewSchedule) -> ViewSchedule:
+        prefix = f'VIEW_{name.upper()}_'
+        return ViewSchedule(min_interval=float(os.getenv(prefix + 'MIN_INTERVAL', default.min_interval)),
+                            debounce=float(os.getenv(prefix + 'DEBOUNCE', default.debounce)),
+                            deadline=float(os.getenv(prefix + 'DEADLINE', default.deadline)),
+                            timeout=float(os.getenv(prefix + 'TIMEOUT', default.timeout)))
+
+    def __on_ticks(self, snapshot: Snapshot):
+        if len(self.__ticks.update(snapshot.data)) > 0:
+            self.__scheduler.mark_dirty(TimerCommands.ViewNames.TICK)
+
+    def __on_scores(self, snapshot: Snapshot):
+        command_cache.invalidate('scores')
+        command_cache.invalidate('admin_scores')
+        changed = self.__scores.update(snapshot.data)
+        logging.info(f'{len(changed)} scores have changed')
+        if len(changed) > 0:
+            self.__scheduler.mark_dirty(TimerCommands.ViewNames.SCORES, TimerCommands.ViewNames.MINMAX)
+
+    async def __publish_view(self, view: str, subject: str, send):
+        snapshot: Snapshot = self.__store.get(subject)
+        if snapshot is None or self.__rendered_versions.get(view) == snapshot.version:
+            return
 
-        # messages = await self.__tick_channel.history(limit=10).flatten()
+        await send(snapshot)
+        self.__rendered_versions[view] = snapshot.version
 
-        # if len(messages) <= len(self.__functions):
-        #     return
+    @staticmethod
+    def get_utc():
+        return datetime.utcnow().replace(microsecond=0)
 
-        await self.__tick_channel.purge(check=is_me)
+    async def __load_view_messages(self):
+        views = [TimerCommands.ViewNames.TICK, TimerCommands.ViewNames.MINMAX, TimerCommands.ViewNames.EPOCH,
+                 TimerCommands.ViewNames.SCORES, TimerCommands.ViewNames.REVENUES]
+        results = await asyncio.gather(*[target.load(views) for target in self.__targets], return_exceptions=True)
+        for target, result in zip(self.__targets, results):
+            if isinstance(result, Exception):
+                logging.warning(f'TimerCommands: failed to load messages of channel {target.id}: {result!r}')
+
+    async def __on_raw_message_delete(self, payload: RawMessageDeleteEvent):
+        for target in self.__targets:
+            if target.id != payload.channel_id:
+                continue
 
-        return
+            view = await target.on_message_deleted(payload.message_id)
+            if view is not None:
+                # Other targets keep their digests and skip the re-render
+                self.__rendered_versions.pop(view, None)
+                self.__scheduler.mark_dirty(view)
 
     async def start(self):
-        print("Cleanup")
-        await self.__cleanup()
+        print("Load messages")
+        await self.__load_view_messages()
+        self.__bot.add_listener(self.__on_raw_message_delete, 'on_raw_message_delete')
         print("Start")
+        self.__dispatcher.start()
+        self.__scheduler.start()
+        if self.__history_writer is not None:
+            self.__history_writer.start()
         task = asyncio.create_task(self.loop())
         task.add_done_callback(self.__background_tasks.remove)
         self.__background_tasks.append(task)
 
-        self.__background_tasks.append(asyncio.create_task(
-            HandlerStarter.start(HandlerTick(self.__nc))))
-        self.__background_tasks.append(asyncio.create_task(
-            HandlerStarter.start(HandlerScores(self.__nc))))
-        self.__background_tasks.append(asyncio.create_task(
-            HandlerStarter.start(HandlerRevenues(self.__nc))))
-        self.__background_tasks.append(asyncio.create_task(
-            HandlerStarter.start(HandlerEpoch(self.__nc))))
+        for handler_type in [HandlerTick, HandlerScores, HandlerRevenues, HandlerEpoch,
+                             HandlerScoresDelta, HandlerRevenuesDelta]:
+            supervisor = HandlerSupervisor(handler_type(self.__nc, self.__store),
+                                           min_delay=float(os.getenv('HANDLER_MIN_RETRY_DELAY', 1)),
+                                           max_delay=float(os.getenv('HANDLER_MAX_RETRY_DELAY', 30)))
+            self.__supervisors.append(supervisor)
+            self.__background_tasks.append(asyncio.create_task(supervisor.run()))
 
     @classmethod
     def set_time_to_footer(cls, e=Embed):
         e.set_footer(text=str(TimerCommands.get_utc()))
 
-    async def __send_scores(self):
-        from datetime import datetime
-        if len(_scores) <= 0:
+    async def __send_scores(self, snapshot: Snapshot):
+        if len(self.__scores) <= 0:
             return
 
         pretty_scores = []
-        sorted_scores = sorted(
-            _scores.items(), key=lambda x: x[1]['s'], reverse=True)
-        logging.info(f'sorted: \n{sorted_scores}')
         ln = 1
         data: dict = None
-        for id, data in sorted_scores:
+        for id, data in self.__scores:
             try:
                 score = data.get('s', 0)
                 real_score = data.get('r', 0)
                 timestamp = float(data.get('t', 0))
-                logging.info(f'score: {score}')
-                logging.info(f'tsm: {timestamp}')
                 pretty_scores.append('{0} {1} {2}/{3} {4}'.format(
                     ln, id,  real_score, score, datetime.utcfromtimestamp(timestamp)))
                 ln += 1
@@ -238,157 +428,180 @@ class TimerCommands():
                 logging.exception(e)
                 continue
 
-        logging.info(f'pretty:\n{pretty_scores}')
-
-        file_name = prepare_file_name('scores.txt')
-        message: Message = await self.__get_last_file_message("scores")
-        await self.__send_edit_file_message(message=message, file_name=file_name, content=f"{os.linesep}".join(pretty_scores))
+        await self.__send_file_view(TimerCommands.ViewNames.SCORES, 'scores.txt', f"{os.linesep}".join(pretty_scores))
 
-    async def __send_revenues(self):
-        if len(_revenues) <= 0:
+    async def __send_revenues(self, snapshot: Snapshot):
+        revenues: RevenueTable = snapshot.data
+        if len(revenues) <= 0:
             return
 
-        pretty_revenues = []
-        for k, v_list in _revenues.items():
-            rev_number = len(v_list)
-            if rev_number <= 0:
-                value = 0
-                percent = 0
-            else:
-                index = QUORUM - 1 if rev_number >= QUORUM else rev_number - 1
-                value = sorted(v_list)[index]
-                percent = int(value * 100 / MAX_REVENUE_VALUE)
-
-            pretty_revenues.append((k, value, percent, rev_number))
-
-            # pretty_revenues.append(
-            #     '{0} {1:>{rev_offset}} {2:>3}% (NoV: {3:>3})'.format(k, value, percent, rev_number, rev_offset=TimerCommands.digets_in_revenue))
-
-        sorted_pretty_revenues = sorted(
-            pretty_revenues, key=lambda x: x[2], reverse=True)
+        sorted_pretty_revenues = revenues.quorum()
         pretty_revenues = ['{0} {1:>{rev_offset}} {2:>3}% (NoV: {3:>3})'.format(
             x[0], x[1], x[2], x[3], rev_offset=TimerCommands.digets_in_revenue) for x in sorted_pretty_revenues]
 
-        file_name = prepare_file_name('revenues.txt')
-        message: Message = await self.__get_last_file_message('revenues')
-        await self.__send_edit_file_message(message=message, file_name=file_name, content=f"{os.linesep}".join(pretty_revenues))
-
-    async def __send_epoch(self):
-        global _epoch
-        global _last_epoch
+        await self.__send_file_view(TimerCommands.ViewNames.REVENUES, 'revenues.txt', f"{os.linesep}".join(pretty_revenues))
 
-        if _epoch is None or _last_epoch == _epoch:
+    async def __send_epoch(self, snapshot: Snapshot):
+        if snapshot.data is None:
             return
 
-        _last_epoch = _epoch
-
-        message = self.__epoch_message
-        if message is None:
-            message = await self.__get_last_epoch_message()
-            self.__epoch_message = message
-
-        description = str(_epoch)
-        e = Embed(title=TimerCommands.MessageTitles.EPOCH,
-                  description=description)
-
-        if message != None:
-            await message.edit(embed=e)
-        else:
-            self.__epoch_message = await self.__tick_channel.send(embed=e)
+        await self.__send_embed_view(TimerCommands.ViewNames.EPOCH, TimerCommands.MessageTitles.EPOCH,
+                                     str(snapshot.data), with_time=False)
 
-    async def __send_min_max(self):
-        from qubic.qubicdata import NUMBER_OF_COMPUTORS
-        if len(_scores) <= 0:
+    async def __send_min_max(self, snapshot: Snapshot):
+        if len(self.__scores) <= 0:
             return
 
-        computor_scores = list(_scores.values())[:NUMBER_OF_COMPUTORS]
-        min_comp_score = min(computor_scores, key=lambda x: x.get('s', 0)).get('s', 0)
-        max_comp_score = max(computor_scores, key=lambda x: x.get('s', 0)).get('s', 0)
-
-        message = self.__minmax_message
-        if message is None:
-            message = await self.__get_last_minmax_message()
-            self.__minmax_message = message
-
-        description = f'[{min_comp_score}..{max_comp_score}]'
-        e = Embed(title=TimerCommands.MessageTitles.MINMAX,
-                  description=description)
-        self.set_time_to_footer(e)
-        if message != None:
-            await message.edit(embed=e)
-        else:
-            self.__minmax_message = await self.__tick_channel.send(embed=e)
+        min_comp_score = self.__scores.min_score
+        max_comp_score = self.__scores.max_score
 
-    async def __send_tick(self):
-        import itertools
-        global _ticks
+        await self.__send_embed_view(TimerCommands.ViewNames.MINMAX, TimerCommands.MessageTitles.MINMAX,
+                                     f'[{min_comp_score}..{max_comp_score}]')
 
+    async def __send_tick(self, snapshot: Snapshot):
         pretty_tick = []
-        pairs = [(k, len(list(g)))
-                 for k, g in itertools.groupby(sorted(_ticks.values(), reverse=True))]
-
-        for k, v in pairs:
+        for k, v in self.__ticks.histogram():
             tick = k - 1
             amount = v
             pretty_tick.append('{0} {1:>2}'.format(tick,  amount))
 
         if len(pretty_tick) > 0:
-            message: Message = self.__tick_message
-            if message is None:
-                message = await self.__get_last_tick_message()
-                self.__tick_message = message
+            await self.__send_embed_view(TimerCommands.ViewNames.TICK, TimerCommands.MessageTitles.TICK,
+                                         f'{os.linesep}'.join(pretty_tick))
+
+    async def __fan_out(self, view: str, targets: list, send):
+        results = await asyncio.gather(*[send(target) for target in targets], return_exceptions=True)
+        failed = [(target, result) for target, result in zip(targets, results) if isinstance(result, Exception)]
+        for target, e in failed:
+            logging.warning(f'TimerCommands: failed to publish {view} to channel {target.id}: {e!r}')
+
+        # Failing keeps the version unrendered, the scheduler retries and healthy targets skip by digest.
+        # Targets that went into backoff are left out, they catch up on a later change once available
+        failed = [(target, e) for target, e in failed if target.is_available]
+        if len(failed) > 0:
+            raise failed[0][1]
+
+    async def __send_embed_view(self, view: str, title: str, description: str, with_time: bool = True):
+        digest = RenderCache.digest(title, description)
+        targets = [target for target in self.__targets if target.is_available and target.is_changed(view, digest)]
+        if len(targets) <= 0:
+            return
 
-            e = Embed(title=TimerCommands.MessageTitles.TICK,
-                      description=f'{os.linesep}'.join(pretty_tick))
+        e = Embed(title=title, description=description)
+        if with_time:
             self.set_time_to_footer(e)
-            if message != None:
-                await message.edit(embed=e)
-            else:
-                self.__tick_message = await self.__tick_channel.send(embed=e)
-
-    async def __get_last_file_message(self, file_name: str, limit=100):
-        message: Message = None
-        async for message in self.__tick_channel.history(limit=limit):
-            a: Attachment = None
-            for a in message.attachments:
-                if a.filename.startswith(file_name):
-                    return message
-
-        return None
-
-    async def __send_edit_file_message(self, message: Message = None, file_name: str = "", content: str = ""):
-        if file_name == None:
-            logging.warning(
-                "TimerCommands.__send_edit_file_message: file_name is empty")
+
+        await self.__fan_out(view, targets, lambda target: target.send_embed(view, digest, e))
+
+    async def __send_file_view(self, view: str, file_name: str, content: str):
+        digest = RenderCache.digest(content)
+        targets = [target for target in self.__targets if target.is_available and target.is_changed(view, digest)]
+        if len(targets) <= 0:
             return
 
-        b = content.encode('utf-8')
+        attachments = prepare_attachments(prepare_file_name(file_name), content)
+        timestamp = str(TimerCommands.get_utc())
+        await self.__fan_out(view, targets, lambda target: target.send_files(view, digest, timestamp, attachments))
 
-        file = File(BytesIO(b), filename=file_name)
+    def handlers_status(self) -> dict:
+        return {supervisor.handler.subject: supervisor.status() for supervisor in self.__supervisors}
 
-        time = str(datetime.utcnow().replace(microsecond=0))
-        if message != None:
-            await message.delete()
+    def targets_status(self) -> dict:
+        return {target.id: target.status() for target in self.__targets}
 
-        await self.__tick_channel.send(time, file=file)
+    def log_handlers_status(self):
+        logging.info(f'TimerCommands: handlers {self.handlers_status()}')
+        logging.info(f'TimerCommands: targets {self.targets_status()}')
+        if self.__nc is not None:
+            logging.info(f'TimerCommands: nats {self.__nc.metrics}')
 
     async def loop(self):
+        stats_interval = float(os.getenv('RENDER_STATS_INTERVAL', 300))
         while True:
-            tasks = []
-            for function in self.__functions:
-                tasks.append(asyncio.create_task(
-                    function(), name=function.__name__))
-            tasks.append(asyncio.create_task(asyncio.sleep(30)))
-
-            done, pending = await asyncio.wait(tasks, timeout=61, return_when=asyncio.ALL_COMPLETED)
-            task: asyncio.Task = None
-            for task in done:
-                e = task.exception()
-                name = task.get_name()
-                if isinstance(e, Exception):
-                    print(f"{name} threw {type(e)}")
-
-            for task in pending:
-                name = task.get_name()
-                print(f"{name} is pending")
-                task.cancel()
+            await asyncio.sleep(stats_interval)
+            for target in self.__targets:
+                target.render_cache.log_stats(str(target.id))
+            self.__dispatcher.log_metrics()
+            command_cache.log_metrics()
+            if self.__history_writer is not None:
+                self.__history_writer.log_metrics()
+            self.log_handlers_status()
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+
+    # Checks the startup bootstrap against a live nats-server (NATS_SERVERS) for both DATA_BOOTSTRAP modes
+    SUBJECT = 'qubic.bench.bootstrap.ticks'
+    STREAM = 'QUBIC_BENCH_BOOTSTRAP'
+    SEQUENCE = 42
+
+    logging.basicConfig(level=logging.INFO)
+    payload = {str(i): 1000000 + i for i in range(676)}
+    body = json.dumps(payload).encode('utf-8')
+    headers = {DataHeaders.SEQUENCE: str(SEQUENCE)}
+
+    class BenchRequestHandler(HandlerTick):
+        subject = SUBJECT
+        bootstrap = True
+        bootstrap_mode = 'request'
+
+    class BenchJetStreamHandler(HandlerTick):
+        subject = SUBJECT
+        bootstrap = True
+        bootstrap_mode = 'jetstream'
+        bootstrap_stream = STREAM
+
+    async def first_snapshot(nc: Nats, handler_type: type) -> tuple:
+        store = StateStore()
+        landed = asyncio.Event()
+        store.subscribe(SUBJECT, lambda snapshot: landed.set())
+        handler = handler_type(nc, store)
+        started = time.perf_counter()
+        task = asyncio.create_task(handler.loop())
+        try:
+            # No live message is published, only the bootstrap can fill the store
+            await asyncio.wait_for(landed.wait(), handler.bootstrap_timeout)
+        finally:
+            await handler.cancel()
+            task.cancel()
+            await asyncio.wait({task})
+
+        return time.perf_counter() - started, store.get(SUBJECT)
+
+    async def main() -> bool:
+        nc = Nats()
+        if await nc.connect() is None:
+            return False
+
+        async def respond(msg: Msg):
+            await nc.nc.publish(msg.reply, body, headers=headers)
+
+        responder = await nc.subscribe(f'{SUBJECT}.snapshot', cb=respond)
+        js = nc.nc.jetstream()
+        await js.add_stream(name=STREAM, subjects=[SUBJECT])
+        await js.publish(SUBJECT, body, headers=headers)
+
+        ok = True
+        try:
+            for handler_type in [BenchRequestHandler, BenchJetStreamHandler]:
+                try:
+                    elapsed, snapshot = await first_snapshot(nc, handler_type)
+                except asyncio.TimeoutError:
+                    print(f'{handler_type.bootstrap_mode:<10} no snapshot within {handler_type.bootstrap_timeout} s')
+                    ok = False
+                    continue
+
+                matches = dict(snapshot.data) == payload and snapshot.sequence == SEQUENCE
+                ok = ok and matches
+                print(f'{handler_type.bootstrap_mode:<10} first snapshot in {elapsed * 1000:.1f} ms, '
+                      f'sequence {snapshot.sequence}, {"ok" if matches else "MISMATCH"}')
+        finally:
+            await responder.unsubscribe()
+            await js.delete_stream(STREAM)
+            await nc.close()
+
+        return ok
+
+    sys.exit(0 if asyncio.run(main()) else 1)
@@ -0,0 +1,80 @@
+import gzip
+import json
+import os
+import re
+from io import BytesIO
+
+from discord import File
+from discord.http import HTTPClient, Route
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DISCORD_MAX_FILE_SIZE = 8 * 1024 * 1024
+
+_COMPRESS_THRESHOLD = int(os.getenv('ATTACHMENT_COMPRESS_THRESHOLD', 512 * 1024))
+_COMPRESSION = os.getenv('ATTACHMENT_COMPRESSION', 'gzip')
+_MAX_FILE_SIZE = int(os.getenv('ATTACHMENT_MAX_FILE_SIZE', DISCORD_MAX_FILE_SIZE))
+_PART_SUFFIX = re.compile(r'\.(\d{3})$')
+
+
+# Editing attachments of an existing message needs API v9, discord.py 1.7 talks v7
+class RouteV9(Route):
+    BASE = 'https://discord.com/api/v9'
+
+
+def compress(file_name: str, data: bytes) -> tuple:
+    if len(data) < _COMPRESS_THRESHOLD:
+        return file_name, data
+
+    if _COMPRESSION == 'zstd':
+        try:
+            import zstandard
+
+            return file_name + '.zst', zstandard.ZstdCompressor().compress(data)
+        except ImportError:
+            pass
+
+    return file_name + '.gz', gzip.compress(data, mtime=0)
+
+
+def prepare_attachments(file_name: str, content: str) -> list:
+    file_name, data = compress(file_name, content.encode('utf-8'))
+    if len(data) <= _MAX_FILE_SIZE:
+        return [(file_name, data)]
+
+    parts = range(0, len(data), _MAX_FILE_SIZE)
+    return [(f'{file_name}.{number + 1:03}', data[offset:offset + _MAX_FILE_SIZE])
+            for number, offset in enumerate(parts)]
+
+
+def part_number(file_name: str) -> int:
+    match = _PART_SUFFIX.search(file_name)
+    return int(match.group(1)) if match is not None else 1
+
+
+# Discord limits the total upload of a message, so every part of a split file is a message of its own
+def part_view(view: str, number: int) -> str:
+    return view if number <= 1 else f'{view}.{number:03}'
+
+
+def base_view(view: str) -> str:
+    return view.split('.')[0]
+
+
+def to_files(attachments: list) -> list:
+    return [File(BytesIO(data), filename=name) for name, data in attachments]
+
+
+async def edit_message_files(http: HTTPClient, channel_id: int, message_id: int, content: str, files: list):
+    r = RouteV9('PATCH', '/channels/{channel_id}/messages/{message_id}',
+                channel_id=channel_id, message_id=message_id)
+    # An empty attachments list drops the old files, uploaded ones are added
+    form = [{'name': 'payload_json', 'value': json.dumps({'content': content, 'attachments': []})}]
+    for index, file in enumerate(files):
+        form.append({'name': f'files[{index}]',
+                     'value': file.fp,
+                     'filename': file.filename,
+                     'content_type': 'application/octet-stream'})
+
+    return await http.request(r, form=form, files=files)
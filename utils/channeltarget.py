@@ -0,0 +1,211 @@
+import logging
+import time
+
+from discord import Client, Embed, HTTPException, Message, NotFound
+
+from utils.attachments import base_view, edit_message_files, part_view, to_files
+from utils.dispatcher import Dispatcher
+from utils.historyindex import HistoryIndex
+from utils.messageregistry import MessageRegistry
+from utils.rendercache import RenderCache
+
+
+class ChannelTarget():
+    def __init__(self, bot: Client, channel, registry: MessageRegistry, history: HistoryIndex,
+                 dispatcher: Dispatcher, priorities: dict, rate_limit_penalty: float = 5,
+                 failure_threshold: int = 3, min_backoff: float = 30, max_backoff: float = 3600) -> None:
+        self.__bot = bot
+        self.__channel = channel
+        self.__registry = registry
+        self.__history = history
+        self.__dispatcher = dispatcher
+        self.__priorities = priorities
+        self.__rate_limit_penalty = rate_limit_penalty
+        self.__failure_threshold = max(1, failure_threshold)
+        self.__min_backoff = min_backoff
+        self.__max_backoff = max_backoff
+        self.__messages = dict()
+        self.__render_cache = RenderCache()
+        self.__failures = 0
+        self.__consecutive_failures = 0
+        self.__backoff_until = 0.0
+
+    @property
+    def id(self) -> int:
+        return self.__channel.id
+
+    @property
+    def render_cache(self) -> RenderCache:
+        return self.__render_cache
+
+    def is_changed(self, view: str, digest: str) -> bool:
+        return self.__render_cache.is_changed(view, digest)
+
+    @property
+    def is_available(self) -> bool:
+        return time.monotonic() >= self.__backoff_until
+
+    def status(self) -> dict:
+        return {'views': list(self.__messages.keys()),
+                'failures': self.__failures,
+                'consecutive_failures': self.__consecutive_failures,
+                'backoff': round(max(0.0, self.__backoff_until - time.monotonic()), 1)}
+
+    async def __fetch_registered_message(self, view: str) -> Message:
+        message_id = self.__registry.get(view, self.id)
+        if message_id is None:
+            return None
+
+        try:
+            return await self.__channel.fetch_message(message_id)
+        except NotFound:
+            logging.info(f'ChannelTarget {self.id}: registered message of {view} is gone')
+            await self.__registry.remove(view)
+            return None
+
+    async def __get_view_message(self, view: str) -> Message:
+        message = self.__messages.get(view)
+        if message is not None:
+            return message
+
+        message = await self.__fetch_registered_message(view)
+        if message is None:
+            message = await self.__history.get(self.__channel, self.__bot.user, view)
+
+        if message is not None:
+            await self.__set_view_message(view, message)
+
+        return message
+
+    async def __set_view_message(self, view: str, message: Message):
+        self.__messages[view] = message
+        await self.__registry.set(view, self.id, message.id)
+
+    async def __forget_view_message(self, view: str):
+        self.__messages.pop(view, None)
+        await self.__registry.remove(view)
+
+    async def load(self, views: list):
+        self.__registry.load()
+        for view in views:
+            message = await self.__fetch_registered_message(view)
+            if message is not None:
+                self.__messages[view] = message
+
+    async def on_message_deleted(self, message_id: int) -> str | None:
+        self.__history.invalidate(message_id)
+        for view, message in list(self.__messages.items()):
+            if message.id == message_id:
+                logging.info(f'ChannelTarget {self.id}: message of {view} was deleted')
+                await self.__forget_view_message(view)
+                # A missing part leaves the whole file incomplete
+                view = base_view(view)
+                self.__render_cache.invalidate(view)
+                return view
+
+        return None
+
+    async def send_embed(self, view: str, digest: str, e: Embed):
+        if not self.__render_cache.is_changed(view, digest):
+            return
+
+        async def publish():
+            message: Message = await self.__get_view_message(view)
+            if message is not None:
+                try:
+                    await message.edit(embed=e)
+                    return
+                except NotFound:
+                    await self.__forget_view_message(view)
+
+            await self.__set_view_message(view, await self.__channel.send(embed=e))
+
+        if await self.__dispatch(view, publish) is not Dispatcher.SUPERSEDED:
+            self.__render_cache.commit(view, digest)
+
+    async def __publish_files(self, view: str, content: str, attachments: list) -> Message:
+        message: Message = await self.__get_view_message(view)
+        if message is not None:
+            try:
+                await edit_message_files(self.__bot.http, self.id, message.id, content, to_files(attachments))
+                return message
+            except NotFound:
+                await self.__forget_view_message(view)
+            except HTTPException as e:
+                if e.status == 429:
+                    raise e
+
+                logging.warning(f'ChannelTarget {self.id}: failed to edit the {view} files ({e.status}), resending')
+                self.__messages.pop(view, None)
+                try:
+                    await message.delete()
+                except NotFound:
+                    pass
+
+        message = await self.__channel.send(content, files=to_files(attachments))
+        await self.__set_view_message(view, message)
+        return message
+
+    async def __delete_view_message(self, view: str) -> bool:
+        message: Message = await self.__get_view_message(view)
+        if message is None:
+            return False
+
+        await self.__forget_view_message(view)
+        try:
+            await message.delete()
+        except NotFound:
+            pass
+
+        return True
+
+    async def send_files(self, view: str, digest: str, content: str, attachments: list):
+        if not self.__render_cache.is_changed(view, digest):
+            return
+
+        async def publish():
+            message = None
+            parts = len(attachments)
+            for number, attachment in enumerate(attachments, start=1):
+                part_content = content if parts <= 1 else f'{content} ({number}/{parts})'
+                message = await self.__publish_files(part_view(view, number), part_content, [attachment])
+
+            # Parts left over from a larger file
+            number = parts + 1
+            while await self.__delete_view_message(part_view(view, number)):
+                number += 1
+
+            return message
+
+        message = await self.__dispatch(view, publish)
+        if message is not None and message is not Dispatcher.SUPERSEDED:
+            self.__render_cache.commit(view, digest)
+
+    async def __dispatch(self, view: str, publish):
+        try:
+            result = await self.__dispatcher.submit(self.id, (self.id, view), publish, self.__priorities[view])
+        except Exception as e:
+            self.__on_failure(view, e)
+            raise e
+
+        if result is not Dispatcher.SUPERSEDED:
+            self.__consecutive_failures = 0
+        return result
+
+    def __on_failure(self, view: str, e: Exception):
+        self.__failures += 1
+        if isinstance(e, HTTPException) and e.status == 429:
+            logging.warning(f'ChannelTarget {self.id}: {view} was rate limited')
+            self.__dispatcher.penalize(self.id, self.__rate_limit_penalty)
+            return
+
+        # A channel that keeps failing (missing permissions, deleted) is paused instead of retried every cycle
+        self.__consecutive_failures += 1
+        if self.__consecutive_failures < self.__failure_threshold:
+            return
+
+        attempt = min(self.__consecutive_failures - self.__failure_threshold, 16)
+        delay = min(self.__max_backoff, self.__min_backoff * (2 ** attempt))
+        self.__backoff_until = time.monotonic() + delay
+        logging.warning(f'ChannelTarget {self.id}: {self.__consecutive_failures} failures in a row, '
+                        f'pausing for {delay:.0f} s')
@@ -0,0 +1,212 @@
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from functools import partial
+
+
+class TokenBucket():
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.__rate = rate
+        self.__capacity = capacity
+        self.__tokens = capacity
+        self.__updated = time.monotonic()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated) * self.__rate)
+        self.__updated = now
+
+    def delay(self) -> float:
+        self.__refill()
+        if self.__tokens >= 1:
+            return 0.0
+
+        return (1 - self.__tokens) / self.__rate
+
+    def take(self):
+        self.__refill()
+        self.__tokens -= 1
+
+    def penalize(self, seconds: float):
+        self.__refill()
+        self.__tokens = min(self.__tokens, 1 - seconds * self.__rate)
+
+
+@dataclass
+class _Job:
+    priority: int
+    order: int
+    route: object
+    key: object
+    func: object
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class Dispatcher():
+    SUPERSEDED = object()
+
+    def __init__(self, rate: float = 1.0, capacity: float = 5.0, max_queue: int = 100, timeout: float = 30.0,
+                 concurrency: int = 1) -> None:
+        self.__timeout = timeout
+        self.__concurrency = max(1, concurrency)
+        self.__rate = rate
+        self.__capacity = capacity
+        self.__max_queue = max_queue
+        self.__buckets = dict()
+        self.__jobs = []
+        self.__by_key = dict()
+        self.__order = itertools.count()
+        self.__wakeup = asyncio.Event()
+        self.__task = None
+        # One job in flight per route keeps the order of edits within a channel
+        self.__busy_routes = set()
+        self.__running = set()
+        self.__metrics = {'executed': 0, 'superseded': 0, 'rejected': 0, 'failed': 0,
+                          'wait_total': 0.0, 'wait_max': 0.0}
+
+    def __bucket(self, route) -> TokenBucket:
+        bucket = self.__buckets.get(route)
+        if bucket is None:
+            bucket = TokenBucket(self.__rate, self.__capacity)
+            self.__buckets[route] = bucket
+
+        return bucket
+
+    def penalize(self, route, seconds: float):
+        self.__bucket(route).penalize(seconds)
+
+    @property
+    def depth(self) -> int:
+        return len(self.__jobs)
+
+    @property
+    def metrics(self) -> dict:
+        metrics = dict(self.__metrics)
+        wait_total = metrics.pop('wait_total')
+        metrics['wait_avg'] = wait_total / metrics['executed'] if metrics['executed'] > 0 else 0.0
+        metrics['depth'] = self.depth
+        metrics['running'] = len(self.__running)
+        return metrics
+
+    def start(self):
+        if self.__task is None or self.__task.done():
+            self.__task = asyncio.create_task(self.__run(), name='dispatcher')
+
+    async def stop(self):
+        if self.__task is not None:
+            self.__task.cancel()
+            await asyncio.wait({self.__task})
+
+        for task in list(self.__running):
+            task.cancel()
+        if len(self.__running) > 0:
+            await asyncio.wait(set(self.__running))
+
+        for job in self.__jobs:
+            if not job.future.done():
+                job.future.cancel()
+
+        self.__jobs.clear()
+        self.__by_key.clear()
+
+    async def submit(self, route, key, func, priority: int = 0):
+        loop = asyncio.get_running_loop()
+        job: _Job = self.__by_key.get(key) if key is not None else None
+        if job is not None:
+            # A newer pending call for the same key replaces the older one
+            self.__metrics['superseded'] += 1
+            if not job.future.done():
+                job.future.set_result(Dispatcher.SUPERSEDED)
+
+            job.func = func
+            job.priority = min(job.priority, priority)
+            job.future = loop.create_future()
+        else:
+            if len(self.__jobs) >= self.__max_queue:
+                self.__metrics['rejected'] += 1
+                raise asyncio.QueueFull(f'Dispatcher queue is full ({self.__max_queue})')
+
+            job = _Job(priority=priority, order=next(self.__order), route=route,
+                       key=key, func=func, future=loop.create_future())
+            self.__jobs.append(job)
+            if key is not None:
+                self.__by_key[key] = job
+
+        self.__wakeup.set()
+        return await job.future
+
+    def __next_job(self) -> tuple:
+        delay = None
+        for job in sorted(self.__jobs, key=lambda j: (j.priority, j.order)):
+            if job.future.done():
+                self.__remove(job)
+                continue
+
+            if job.route in self.__busy_routes:
+                continue
+
+            job_delay = self.__bucket(job.route).delay()
+            if job_delay <= 0:
+                return job, 0.0
+
+            delay = job_delay if delay is None else min(delay, job_delay)
+
+        return None, delay
+
+    def __remove(self, job: _Job):
+        self.__jobs.remove(job)
+        if job.key is not None and self.__by_key.get(job.key) is job:
+            del self.__by_key[job.key]
+
+    async def __run(self):
+        while True:
+            self.__wakeup.clear()
+            job, delay = None, None
+            if len(self.__running) < self.__concurrency:
+                job, delay = self.__next_job()
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.__wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.__remove(job)
+            self.__bucket(job.route).take()
+            wait = time.monotonic() - job.enqueued
+            self.__metrics['wait_total'] += wait
+            self.__metrics['wait_max'] = max(self.__metrics['wait_max'], wait)
+            self.__metrics['executed'] += 1
+
+            self.__busy_routes.add(job.route)
+            task = asyncio.create_task(self.__execute(job))
+            self.__running.add(task)
+            task.add_done_callback(partial(self.__finished, job.route))
+
+    def __finished(self, route, task: asyncio.Task):
+        self.__running.discard(task)
+        self.__busy_routes.discard(route)
+        self.__wakeup.set()
+
+    async def __execute(self, job: _Job):
+        try:
+            result = await asyncio.wait_for(job.func(), self.__timeout)
+        except asyncio.CancelledError as e:
+            if not job.future.done():
+                job.future.cancel()
+            raise e
+        except Exception as e:
+            self.__metrics['failed'] += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def log_metrics(self):
+        logging.info(f'Dispatcher: {self.metrics}')
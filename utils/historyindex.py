@@ -0,0 +1,68 @@
+import asyncio
+import logging
+
+from discord import Embed, Message
+
+from utils.attachments import part_number, part_view
+
+
+class HistoryIndex():
+    def __init__(self, titles: dict, prefixes: dict, limit: int = 200) -> None:
+        self.__titles = titles
+        self.__prefixes = prefixes
+        self.__limit = limit
+        self.__index = dict()
+        self.__built = False
+        self.__lock = asyncio.Lock()
+
+    def classify(self, message: Message) -> str | None:
+        e: Embed = None
+        for e in reversed(message.embeds):
+            title = e.title if e.title else ''
+            for startwith, view in self.__titles.items():
+                if title.find(startwith) != -1:
+                    return view
+
+        for a in message.attachments:
+            for prefix, view in self.__prefixes.items():
+                if a.filename.startswith(prefix):
+                    return part_view(view, part_number(a.filename))
+
+        return None
+
+    async def build(self, channel, author):
+        index = dict()
+        scanned = 0
+        message: Message = None
+        async for message in channel.history(limit=self.__limit):
+            scanned += 1
+            if message.author != author:
+                continue
+
+            view = self.classify(message)
+            if view is not None and view not in index:
+                index[view] = message
+
+        logging.info(f'HistoryIndex: scanned {scanned} messages, found {list(index.keys())}')
+        self.__index = index
+        self.__built = True
+
+    async def get(self, channel, author, view: str) -> Message | None:
+        async with self.__lock:
+            if not self.__built:
+                await self.build(channel, author)
+
+        return self.__index.get(view)
+
+    def invalidate(self, message_id: int) -> str | None:
+        for view, message in self.__index.items():
+            if message.id == message_id:
+                del self.__index[view]
+                self.__built = False
+                return view
+
+        return None
+
+    def clear(self):
+        self.__index = dict()
+        self.__built = False
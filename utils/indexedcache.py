@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+
+
+class IndexedCache():
+    # load() returns (items, ttl): items None keeps the current ones (not modified), ttl None uses the default
+    def __init__(self, load, ttl: float = 5.0, id_field: str = 'id', failure_ttl: float = 2.0,
+                 name: str = 'IndexedCache') -> None:
+        self.__load = load
+        self.__ttl = ttl
+        self.__id_field = id_field
+        self.__failure_ttl = failure_ttl
+        self.__name = name
+        self.__items = []
+        self.__index = dict()
+        self.__loaded = False
+        self.__error = None
+        self.__expires = 0.0
+        self.__lock = asyncio.Lock()
+        self.__metrics = {'hits': 0, 'refreshes': 0, 'not_modified': 0, 'failures': 0}
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.__expires
+
+    async def __refresh(self):
+        try:
+            items, ttl = await self.__load()
+        except Exception as e:
+            self.__metrics['failures'] += 1
+            self.__error = e
+            # Until the backoff runs out the last items, or the error without any, are served without a round trip
+            self.__expires = time.monotonic() + self.__failure_ttl
+            logging.warning(f'{self.__name}: refresh failed, retrying in {self.__failure_ttl} s: {e!r}')
+            return
+
+        if items is None:
+            self.__metrics['not_modified'] += 1
+        else:
+            self.__items = items
+            self.__index = {item[self.__id_field]: item for item in items if self.__id_field in item}
+            self.__loaded = True
+            self.__metrics['refreshes'] += 1
+
+        self.__error = None
+        self.__expires = time.monotonic() + (ttl if ttl is not None else self.__ttl)
+
+    async def __ensure_fresh(self):
+        if self.is_fresh:
+            self.__metrics['hits'] += 1
+        else:
+            # Only one refresh in flight, the waiters find the cache fresh afterwards
+            async with self.__lock:
+                if self.is_fresh:
+                    self.__metrics['hits'] += 1
+                else:
+                    await self.__refresh()
+
+        if not self.__loaded and self.__error is not None:
+            raise self.__error.with_traceback(None)
+
+    async def get(self) -> list:
+        await self.__ensure_fresh()
+        return self.__items
+
+    async def get_by_id(self, id: str) -> dict | None:
+        await self.__ensure_fresh()
+        return self.__index.get(id)
+
+    def invalidate(self):
+        self.__expires = 0.0
+
+    @property
+    def metrics(self) -> dict:
+        metrics = dict(self.__metrics)
+        metrics['entries'] = len(self.__index)
+        return metrics
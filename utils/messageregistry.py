@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+
+import aiofiles
+
+
+class MessageRegistry():
+    CHANNEL_ID_FIELD = 'channel_id'
+    MESSAGE_ID_FIELD = 'message_id'
+
+    def __init__(self, path: str, fallback_path: str = None) -> None:
+        self.__path = path
+        self.__fallback_path = fallback_path
+        self.__entries = dict()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def load(self):
+        path = self.__path
+        if not os.path.isfile(path):
+            # Entries carry their channel id, so a shared legacy file is safe to seed from
+            path = self.__fallback_path
+            if path is None or not os.path.isfile(path):
+                self.__entries = dict()
+                return
+
+        try:
+            with open(path, 'r') as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.warning(f'MessageRegistry: failed to load {path}: {e}')
+            self.__entries = dict()
+            return
+
+        if not isinstance(entries, dict):
+            logging.warning(f'MessageRegistry: {path} has an unexpected format')
+            entries = dict()
+
+        self.__entries = entries
+
+    def get(self, view: str, channel_id: int) -> int | None:
+        entry = self.__entries.get(view)
+        if entry is None or entry.get(MessageRegistry.CHANNEL_ID_FIELD) != channel_id:
+            return None
+
+        return entry.get(MessageRegistry.MESSAGE_ID_FIELD)
+
+    async def set(self, view: str, channel_id: int, message_id: int):
+        entry = {MessageRegistry.CHANNEL_ID_FIELD: channel_id,
+                 MessageRegistry.MESSAGE_ID_FIELD: message_id}
+        if self.__entries.get(view) == entry:
+            return
+
+        self.__entries[view] = entry
+        await self.save()
+
+    async def remove(self, view: str):
+        if self.__entries.pop(view, None) is not None:
+            await self.save()
+
+    async def save(self):
+        tmp_path = self.__path + '.tmp'
+        try:
+            async with aiofiles.open(tmp_path, 'w') as file:
+                await file.write(json.dumps(self.__entries))
+
+            os.replace(tmp_path, self.__path)
+        except OSError as e:
+            logging.warning(f'MessageRegistry: failed to save {self.__path}: {e}')
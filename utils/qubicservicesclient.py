@@ -0,0 +1,227 @@
+import asyncio
+import struct
+import time
+from collections import deque
+
+_FRAME_HEADER = struct.Struct('>I')
+_MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def encode_frame(payload: bytes) -> bytes:
+    return _FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader, max_frame_size: int = _MAX_FRAME_SIZE) -> bytes:
+    (size,) = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+    if size > max_frame_size:
+        raise ValueError(f'Frame of {size} bytes exceeds {max_frame_size}')
+
+    return await reader.readexactly(size)
+
+
+class _Connection():
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, max_frame_size: int) -> None:
+        self.__reader = reader
+        self.__writer = writer
+        self.__max_frame_size = max_frame_size
+        # Responses come back in request order, one future per request in flight
+        self.pending = deque()
+        self.closed = False
+        self.__task = asyncio.create_task(self.__read_loop())
+
+    async def __read_loop(self):
+        error = None
+        try:
+            while True:
+                payload = await read_frame(self.__reader, self.__max_frame_size)
+                if len(self.pending) <= 0:
+                    raise ValueError('Unexpected frame without a request')
+
+                future: asyncio.Future = self.pending.popleft()
+                # A timed out request still owns its slot, its late response is dropped here
+                if not future.done():
+                    future.set_result(payload)
+        except asyncio.CancelledError:
+            error = ConnectionError('Connection closed')
+        except Exception as e:
+            error = e
+        finally:
+            self.close(error)
+
+    async def send(self, payload: bytes) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.__writer.write(encode_frame(payload))
+        await self.__writer.drain()
+        return future
+
+    def close(self, error: Exception = None):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.__writer.close()
+        if not self.__task.done() and self.__task is not asyncio.current_task():
+            self.__task.cancel()
+
+        while len(self.pending) > 0:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error if error is not None else ConnectionError('Connection closed'))
+
+
+class QubicServicesClient():
+    def __init__(self, host: str, port: int, pool_size: int = 2, connect_timeout: float = 5,
+                 read_timeout: float = 5, max_frame_size: int = _MAX_FRAME_SIZE) -> None:
+        self.__host = host
+        self.__port = port
+        self.__pool_size = max(1, pool_size)
+        self.__connect_timeout = connect_timeout
+        self.__read_timeout = read_timeout
+        self.__max_frame_size = max_frame_size
+        self.__connections = []
+        self.__connect_lock = asyncio.Lock()
+        self.__metrics = {'requests': 0, 'connects': 0, 'failures': 0, 'pipelined_max': 0}
+
+    async def __connect(self) -> _Connection:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.__host, self.__port),
+                                                    self.__connect_timeout)
+        except asyncio.exceptions.TimeoutError:
+            raise asyncio.exceptions.TimeoutError(
+                f'QubicServicesClient: failed to connect to {self.__host}:{self.__port}')
+
+        self.__metrics['connects'] += 1
+        return _Connection(reader, writer, self.__max_frame_size)
+
+    def __least_busy(self) -> _Connection:
+        self.__connections = [c for c in self.__connections if not c.closed]
+        return min(self.__connections, key=lambda c: len(c.pending), default=None)
+
+    async def __connection(self) -> _Connection:
+        connection = self.__least_busy()
+        if connection is not None and (len(connection.pending) <= 0 or len(self.__connections) >= self.__pool_size):
+            return connection
+
+        async with self.__connect_lock:
+            connection = self.__least_busy()
+            if connection is not None and (len(connection.pending) <= 0 or
+                                           len(self.__connections) >= self.__pool_size):
+                return connection
+
+            connection = await self.__connect()
+            self.__connections.append(connection)
+            return connection
+
+    async def request(self, payload: bytes) -> bytes:
+        self.__metrics['requests'] += 1
+        connection = await self.__connection()
+        try:
+            future = await connection.send(payload)
+            self.__metrics['pipelined_max'] = max(self.__metrics['pipelined_max'], len(connection.pending))
+            return await asyncio.wait_for(future, self.__read_timeout)
+        except Exception as e:
+            self.__metrics['failures'] += 1
+            # Responses are matched by order, after a timeout or a broken stream the connection is unusable
+            if isinstance(e, (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError)):
+                connection.close(e)
+            raise e
+
+    async def close(self):
+        for connection in self.__connections:
+            connection.close()
+        self.__connections = []
+
+    @property
+    def metrics(self) -> dict:
+        metrics = dict(self.__metrics)
+        metrics['connections'] = len([c for c in self.__connections if not c.closed])
+        return metrics
+
+
+if __name__ == '__main__':
+    import json
+    import random
+    import string
+
+    from utils.indexedcache import IndexedCache
+
+    NUMBER_OF_IDS = 676
+    REQUESTS = 500
+    LATENCY = 0.002
+
+    random.seed(0)
+    revenues = [{'id': ''.join(random.choices(string.ascii_uppercase, k=70)), 'revenue': random.randrange(101)}
+                for _ in range(NUMBER_OF_IDS)]
+    body = json.dumps(revenues).encode('utf-8')
+
+    # Stand-ins for qubic_services with a simulated round trip, the legacy one answers once and closes
+    async def handle_legacy(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await asyncio.sleep(LATENCY)
+        writer.write(body)
+        await writer.drain()
+        writer.close()
+
+    async def handle_framed(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                await read_frame(reader)
+                # Responses are delayed without blocking the next request, as on a real link
+                asyncio.get_running_loop().call_later(LATENCY, writer.write, encode_frame(body))
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            await asyncio.sleep(LATENCY)
+            writer.close()
+
+    async def main():
+        legacy = await asyncio.start_server(handle_legacy, '127.0.0.1', 0)
+        framed = await asyncio.start_server(handle_framed, '127.0.0.1', 0)
+        legacy_port = legacy.sockets[0].getsockname()[1]
+        framed_port = framed.sockets[0].getsockname()[1]
+        ids = [revenue['id'] for revenue in revenues]
+
+        async def legacy_request():
+            reader, writer = await asyncio.open_connection('127.0.0.1', legacy_port)
+            data = await reader.read()
+            writer.close()
+            await writer.wait_closed()
+            return data
+
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            assert await legacy_request() == body
+        legacy_time = time.perf_counter() - started
+
+        client = QubicServicesClient('127.0.0.1', framed_port, pool_size=2)
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            assert await client.request(b'revenues') == body
+        sequential_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*[client.request(b'revenues') for _ in range(REQUESTS)])
+        pipelined_time = time.perf_counter() - started
+        assert all(result == body for result in results)
+
+        async def load():
+            return json.loads(await client.request(b'revenues')), None
+
+        index = IndexedCache(load, ttl=5)
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            await index.get_by_id(random.choice(ids))
+        cached_time = time.perf_counter() - started
+
+        print(f'connect per request: {legacy_time / REQUESTS * 1000:.3f} ms/request')
+        print(f'pooled sequential:   {sequential_time / REQUESTS * 1000:.3f} ms/request')
+        print(f'pooled pipelined:    {pipelined_time / REQUESTS * 1000:.3f} ms/request')
+        print(f'cached lookup:       {cached_time / REQUESTS * 1000:.3f} ms/lookup')
+        print(f'client {client.metrics}, index {index.metrics}')
+
+        await client.close()
+        await asyncio.sleep(LATENCY * 2)
+        legacy.close()
+        framed.close()
+
+    asyncio.run(main())
@@ -1,34 +1,43 @@
 
 import asyncio
 import json
+import os
 from asyncio.exceptions import TimeoutError
 
+from utils.indexedcache import IndexedCache
+from utils.qubicservicesclient import QubicServicesClient
 
-__QUBIC_SERVICES_IP = "172.19.0.2"
-__QUBIC_SERVICES_REVENUES_PORT = 21845
+
+__QUBIC_SERVICES_IP = os.getenv("QUBIC_SERVICES_IP", "172.19.0.2")
+__QUBIC_SERVICES_REVENUES_PORT = int(os.getenv("QUBIC_SERVICES_REVENUES_PORT", 21845))
+# "legacy" reads one response to EOF per connection, "framed" keeps pooled length-prefixed connections
+__QUBIC_SERVICES_PROTOCOL = os.getenv("QUBIC_SERVICES_PROTOCOL", "legacy")
 __CONNECTION_TIMEOUT = 5
 __READ_TIMEOUT = 5
 
+__REVENUES_REQUEST = b"revenues"
+
 __ID_FIELD = "id"
 __REVENUE_FIELD = "revenue"
 
+__client = QubicServicesClient(__QUBIC_SERVICES_IP, __QUBIC_SERVICES_REVENUES_PORT,
+                               pool_size=int(os.getenv("QUBIC_SERVICES_POOL_SIZE", 2)),
+                               connect_timeout=__CONNECTION_TIMEOUT, read_timeout=__READ_TIMEOUT)
+
 
 async def get_user_revenues(user_id: str):
     if user_id == "":
         raise ValueError("user_id cannot be empty")
 
-    revenues = await get_revenues()
+    revenue = await revenues_index.get_by_id(user_id)
+    if revenue is None:
+        return None
 
-    for revenue in revenues:
-        id = revenue[__ID_FIELD]
-        if id == user_id:
-            return (id, revenue[__REVENUE_FIELD])
-
-    raise None
+    return (revenue[__ID_FIELD], revenue[__REVENUE_FIELD])
 
 
 async def get_pretty_revenues() -> list:
-    revenues = await get_revenues()
+    revenues = await revenues_index.get()
 
     pretty_revenues = []
 
@@ -41,6 +50,15 @@ async def get_pretty_revenues() -> list:
 
 
 async def get_revenues():
+    if __QUBIC_SERVICES_PROTOCOL == "framed":
+        data = await __client.request(__REVENUES_REQUEST)
+    else:
+        data = await __get_revenues_legacy()
+
+    return json.loads(data.decode())
+
+
+async def __get_revenues_legacy() -> bytes:
     try:
         reader, writer = await asyncio.wait_for(asyncio.open_connection(__QUBIC_SERVICES_IP, __QUBIC_SERVICES_REVENUES_PORT), __CONNECTION_TIMEOUT)
     except asyncio.exceptions.TimeoutError:
@@ -52,8 +70,18 @@ async def get_revenues():
     except asyncio.exceptions.TimeoutError:
         raise asyncio.exceptions.TimeoutError(
             "get_revenues: Failed to read data")
+    finally:
+        writer.close()
+        await writer.wait_closed()
 
-    writer.close()
-    await writer.wait_closed()
+    return data
 
-    return json.loads(data.decode())
+
+async def __load_revenues() -> tuple:
+    return await get_revenues(), None
+
+
+revenues_index = IndexedCache(__load_revenues, ttl=float(os.getenv("QUBIC_SERVICES_CACHE_TTL", 5)),
+                              id_field=__ID_FIELD,
+                              failure_ttl=float(os.getenv("QUBIC_SERVICES_CACHE_FAILURE_TTL", 2)),
+                              name="revenues_index")
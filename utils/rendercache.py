@@ -0,0 +1,56 @@
+import hashlib
+import logging
+
+
+class RenderCache():
+    def __init__(self) -> None:
+        self.__digests = dict()
+        self.__sent = dict()
+        self.__skipped = dict()
+
+    @staticmethod
+    def digest(*parts) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            if part is None:
+                part = b''
+            elif not isinstance(part, (bytes, bytearray)):
+                part = str(part).encode('utf-8')
+
+            h.update(len(part).to_bytes(8, 'little'))
+            h.update(part)
+
+        return h.hexdigest()
+
+    def is_changed(self, view: str, digest: str) -> bool:
+        if self.__digests.get(view) == digest:
+            self.__skipped[view] = self.__skipped.get(view, 0) + 1
+            return False
+
+        return True
+
+    def commit(self, view: str, digest: str):
+        self.__digests[view] = digest
+        self.__sent[view] = self.__sent.get(view, 0) + 1
+
+    def invalidate(self, view: str = None):
+        if view is None:
+            self.__digests.clear()
+        else:
+            self.__digests.pop(view, None)
+
+    @property
+    def sent(self) -> int:
+        return sum(self.__sent.values())
+
+    @property
+    def skipped(self) -> int:
+        return sum(self.__skipped.values())
+
+    def stats(self) -> dict:
+        views = set(self.__sent) | set(self.__skipped)
+        return {view: (self.__sent.get(view, 0), self.__skipped.get(view, 0)) for view in views}
+
+    def log_stats(self, name: str = None):
+        prefix = 'RenderCache' if name is None else f'RenderCache {name}'
+        logging.info(f'{prefix}: sent {self.sent}, skipped {self.skipped}, per view {self.stats()}')
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class ResultCache():
+    def __init__(self, ttl: float = 10.0, max_entries: int = 1024) -> None:
+        self.__ttl = ttl
+        self.__max_entries = max_entries
+        # key -> (expires, value), keys are tuples starting with the command name
+        self.__entries = dict()
+        self.__inflight = dict()
+        self.__generations = dict()
+        self.__epoch = 0
+        self.__metrics = {'hits': 0, 'misses': 0, 'coalesced': 0, 'failures': 0, 'invalidations': 0}
+
+    def __generation(self, command: str) -> tuple:
+        return self.__epoch, self.__generations.get(command, 0)
+
+    async def get(self, key: tuple, func, *args, **kwargs):
+        entry = self.__entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if time.monotonic() < expires:
+                self.__metrics['hits'] += 1
+                return value
+
+            del self.__entries[key]
+
+        task = self.__inflight.get(key)
+        if task is None:
+            self.__metrics['misses'] += 1
+            # The load runs in its own task, a cancelled caller does not cancel it for the others
+            task = asyncio.create_task(self.__load(key, self.__generation(key[0]), func, *args, **kwargs))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self.__inflight[key] = task
+        else:
+            self.__metrics['coalesced'] += 1
+
+        return await asyncio.shield(task)
+
+    async def __load(self, key: tuple, generation: tuple, func, *args, **kwargs):
+        try:
+            value = await func(*args, **kwargs)
+        except Exception as e:
+            self.__metrics['failures'] += 1
+            raise e
+        finally:
+            if self.__inflight.get(key) is asyncio.current_task():
+                del self.__inflight[key]
+
+        # Data that arrived while loading invalidated this result
+        if generation == self.__generation(key[0]):
+            self.__entries.pop(key, None)
+            self.__entries[key] = (time.monotonic() + self.__ttl, value)
+            while len(self.__entries) > self.__max_entries:
+                del self.__entries[next(iter(self.__entries))]
+
+        return value
+
+    def invalidate(self, command: str = None):
+        self.__metrics['invalidations'] += 1
+        if command is None:
+            self.__epoch += 1
+            self.__entries.clear()
+            self.__inflight.clear()
+            return
+
+        self.__generations[command] = self.__generations.get(command, 0) + 1
+        for key in [key for key in self.__entries if key[0] == command]:
+            del self.__entries[key]
+        for key in [key for key in self.__inflight if key[0] == command]:
+            del self.__inflight[key]
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def metrics(self) -> dict:
+        metrics = dict(self.__metrics)
+        lookups = metrics['hits'] + metrics['misses'] + metrics['coalesced']
+        metrics['hit_ratio'] = (metrics['hits'] + metrics['coalesced']) / lookups if lookups > 0 else 0.0
+        metrics['entries'] = len(self.__entries)
+        metrics['inflight'] = len(self.__inflight)
+        return metrics
+
+    def log_metrics(self):
+        logging.info(f'ResultCache: {self.metrics}')
+
+
+command_cache = ResultCache(ttl=float(os.getenv('COMMAND_CACHE_TTL', 10)),
+                            max_entries=int(os.getenv('COMMAND_CACHE_MAX_ENTRIES', 1024)))
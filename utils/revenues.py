@@ -0,0 +1,141 @@
+from qubic.qubicdata import MAX_REVENUE_VALUE, QUORUM
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_EMPTY_VALUE = 0xFFFFFFFF
+
+
+class RevenueTable():
+    def __init__(self, ids: list, values, counts) -> None:
+        self.ids = ids
+        self.values = values
+        self.counts = counts
+
+    @classmethod
+    def from_dict(cls, revenues: dict, use_numpy: bool = True):
+        ids = list(revenues.keys())
+        if np is None or not use_numpy:
+            return cls(ids, [list(v) for v in revenues.values()], [len(v) for v in revenues.values()])
+
+        counts = np.fromiter((len(v) for v in revenues.values()), dtype=np.int64, count=len(ids))
+        width = int(counts.max()) if len(ids) > 0 else 0
+        values = np.full((len(ids), width), _EMPTY_VALUE, dtype=np.uint32)
+        for row, v_list in enumerate(revenues.values()):
+            if len(v_list) > 0:
+                values[row, :len(v_list)] = v_list
+
+        values.flags.writeable = False
+        counts.flags.writeable = False
+        return cls(ids, values, counts)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def updated(self, changes: dict, removed: list = ()):
+        removed = set(removed)
+        if not self.is_numpy:
+            revenues = {id: v_list for id, v_list in zip(self.ids, self.values) if id not in removed}
+            revenues.update(changes)
+            return RevenueTable.from_dict(revenues, use_numpy=False)
+
+        keep = [row for row, id in enumerate(self.ids) if id not in removed]
+        ids = [self.ids[row] for row in keep]
+        index = {id: row for row, id in enumerate(ids)}
+        for id in changes:
+            if id not in index:
+                index[id] = len(ids)
+                ids.append(id)
+
+        old_width = self.values.shape[1]
+        width = max([old_width] + [len(v_list) for v_list in changes.values()])
+        values = np.full((len(ids), width), _EMPTY_VALUE, dtype=np.uint32)
+        values[:len(keep), :old_width] = self.values[keep]
+        counts = np.zeros(len(ids), dtype=np.int64)
+        counts[:len(keep)] = self.counts[keep]
+        for id, v_list in changes.items():
+            row = index[id]
+            values[row, :] = _EMPTY_VALUE
+            if len(v_list) > 0:
+                values[row, :len(v_list)] = v_list
+            counts[row] = len(v_list)
+
+        values.flags.writeable = False
+        counts.flags.writeable = False
+        return RevenueTable(ids, values, counts)
+
+    @property
+    def is_numpy(self) -> bool:
+        return np is not None and isinstance(self.values, np.ndarray)
+
+    def quorum(self) -> list:
+        if len(self.ids) <= 0:
+            return []
+
+        if self.is_numpy:
+            return self.__quorum_numpy()
+
+        return self.__quorum_python()
+
+    def __quorum_python(self) -> list:
+        pretty_revenues = []
+        for k, v_list in zip(self.ids, self.values):
+            rev_number = len(v_list)
+            if rev_number <= 0:
+                value = 0
+                percent = 0
+            else:
+                index = QUORUM - 1 if rev_number >= QUORUM else rev_number - 1
+                value = sorted(v_list)[index]
+                percent = int(value * 100 / MAX_REVENUE_VALUE)
+
+            pretty_revenues.append((k, value, percent, rev_number))
+
+        return sorted(pretty_revenues, key=lambda x: x[2], reverse=True)
+
+    def __quorum_numpy(self) -> list:
+        counts = self.counts
+        width = self.values.shape[1]
+
+        # Rows are padded with _EMPTY_VALUE, so the k-th smallest is exact for full rows
+        # and short rows fall back to their largest reported value
+        if width >= QUORUM:
+            value = np.partition(self.values, QUORUM - 1, axis=1)[:, QUORUM - 1].astype(np.int64)
+        else:
+            value = np.zeros(len(self.ids), dtype=np.int64)
+
+        short = counts < QUORUM
+        if short.any():
+            reported = np.arange(width) < counts[short, None]
+            value[short] = np.where(reported, self.values[short], 0).max(axis=1, initial=0)
+
+        percent = (value.astype(np.float64) * 100 / MAX_REVENUE_VALUE).astype(np.int64)
+        order = np.argsort(-percent, kind='stable')
+
+        ids = self.ids
+        return [(ids[i], int(value[i]), int(percent[i]), int(counts[i])) for i in order.tolist()]
+
+
+if __name__ == '__main__':
+    import random
+    import timeit
+
+    from qubic.qubicdata import NUMBER_OF_COMPUTORS
+
+    random.seed(0)
+    payload = {f'ID{i:066}': [random.randrange(MAX_REVENUE_VALUE) for _ in range(random.choice([NUMBER_OF_COMPUTORS, QUORUM - 1, 10, 0]))]
+               for i in range(NUMBER_OF_COMPUTORS)}
+
+    python_table = RevenueTable.from_dict(payload, use_numpy=False)
+    numpy_table = RevenueTable.from_dict(payload)
+    assert python_table.quorum() == numpy_table.quorum()
+
+    number = 10
+    python_time = timeit.timeit(python_table.quorum, number=number) / number
+    numpy_time = timeit.timeit(numpy_table.quorum, number=number) / number
+    build_time = timeit.timeit(lambda: RevenueTable.from_dict(payload), number=number) / number
+    print(f'python: {python_time * 1000:.2f} ms')
+    print(f'numpy: {numpy_time * 1000:.2f} ms (+{build_time * 1000:.2f} ms to build the array)')
+    print(f'speedup: {python_time / numpy_time:.1f}x')
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ViewSchedule:
+    min_interval: float = 1.0
+    debounce: float = 0.2
+    deadline: float = 1.0
+    timeout: float = 60.0
+
+
+@dataclass
+class _View:
+    name: str
+    publish: object
+    schedule: ViewSchedule
+    dirty: asyncio.Event = field(default_factory=asyncio.Event)
+    last_publish: float = 0.0
+    task: asyncio.Task = None
+
+
+class ViewScheduler():
+    def __init__(self) -> None:
+        self.__views = dict()
+
+    def add_view(self, name: str, publish, schedule: ViewSchedule = None):
+        if name in self.__views:
+            raise ValueError(f'{name} is already scheduled')
+
+        self.__views[name] = _View(name=name, publish=publish,
+                                   schedule=schedule if schedule is not None else ViewSchedule())
+
+    def mark_dirty(self, *names: str):
+        for name in names:
+            view: _View = self.__views.get(name)
+            if view is None:
+                logging.warning(f'ViewScheduler: unknown view {name}')
+                continue
+
+            view.dirty.set()
+
+    def mark_all_dirty(self):
+        self.mark_dirty(*self.__views.keys())
+
+    def start(self):
+        view: _View = None
+        for view in self.__views.values():
+            if view.task is None or view.task.done():
+                view.task = asyncio.create_task(self.__run(view), name=f'view_{view.name}')
+
+    async def stop(self):
+        tasks = [view.task for view in self.__views.values() if view.task is not None]
+        for task in tasks:
+            task.cancel()
+
+        if len(tasks) > 0:
+            await asyncio.wait(tasks)
+
+    async def __debounce(self, view: _View):
+        first_dirty = time.monotonic()
+        while True:
+            view.dirty.clear()
+            left = view.schedule.deadline - (time.monotonic() - first_dirty)
+            timeout = min(view.schedule.debounce, left)
+            if timeout <= 0:
+                return
+
+            try:
+                await asyncio.wait_for(view.dirty.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+
+    async def __run(self, view: _View):
+        while True:
+            await view.dirty.wait()
+            await self.__debounce(view)
+
+            wait = view.last_publish + view.schedule.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            view.last_publish = time.monotonic()
+            try:
+                await asyncio.wait_for(view.publish(), view.schedule.timeout)
+            except asyncio.CancelledError as e:
+                raise e
+            except asyncio.TimeoutError:
+                logging.warning(f'ViewScheduler: {view.name} publishing timed out')
+                view.dirty.set()
+            except Exception as e:
+                logging.exception(e)
+                view.dirty.set()
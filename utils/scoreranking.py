@@ -0,0 +1,87 @@
+from bisect import bisect_left, insort
+
+from qubic.qubicdata import NUMBER_OF_COMPUTORS
+
+SCORE_FIELD = 's'
+
+
+class ScoreRanking():
+    def __init__(self, top: int = NUMBER_OF_COMPUTORS, score_field: str = SCORE_FIELD) -> None:
+        self.__top = top
+        self.__score_field = score_field
+        self.__data = dict()
+        self.__keys = dict()
+        self.__ranking = []
+
+    def __key(self, id: str, data: dict) -> tuple:
+        return (-data.get(self.__score_field, 0), id)
+
+    def update(self, scores: dict) -> set:
+        changed = set()
+        for id in list(self.__data.keys()):
+            if id not in scores:
+                self.__remove(id)
+                changed.add(id)
+
+        for id, data in scores.items():
+            if self.set(id, data):
+                changed.add(id)
+
+        return changed
+
+    def set(self, id: str, data: dict) -> bool:
+        old_data = self.__data.get(id)
+        if old_data == data:
+            return False
+
+        self.__data[id] = data
+        key = self.__key(id, data)
+        old_key = self.__keys.get(id)
+        if old_key == key:
+            return True
+
+        if old_key is not None:
+            del self.__ranking[bisect_left(self.__ranking, old_key)]
+
+        self.__keys[id] = key
+        insort(self.__ranking, key)
+        return True
+
+    def __remove(self, id: str):
+        key = self.__keys.pop(id)
+        del self.__data[id]
+        del self.__ranking[bisect_left(self.__ranking, key)]
+
+    def __len__(self):
+        return len(self.__ranking)
+
+    def __iter__(self):
+        for _, id in self.__ranking:
+            yield id, self.__data[id]
+
+    def get(self, id: str) -> dict | None:
+        return self.__data.get(id)
+
+    def rank(self, id: str) -> int | None:
+        key = self.__keys.get(id)
+        if key is None:
+            return None
+
+        return bisect_left(self.__ranking, key) + 1
+
+    def score_at(self, index: int) -> int:
+        return -self.__ranking[index][0]
+
+    @property
+    def max_score(self) -> int | None:
+        if len(self.__ranking) <= 0:
+            return None
+
+        return self.score_at(0)
+
+    @property
+    def min_score(self) -> int | None:
+        if len(self.__ranking) <= 0:
+            return None
+
+        return self.score_at(min(self.__top, len(self.__ranking)) - 1)
@@ -0,0 +1,62 @@
+import logging
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    subject: str
+    version: int
+    received: float
+    data: object
+    sequence: int = None
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.received
+
+
+class StateStore():
+    def __init__(self) -> None:
+        self.__snapshots = dict()
+        self.__listeners = dict()
+
+    @staticmethod
+    def freeze(data):
+        if isinstance(data, dict):
+            return MappingProxyType(data)
+        if isinstance(data, list):
+            return tuple(data)
+
+        return data
+
+    def publish(self, subject: str, data, received: float = None, sequence: int = None) -> Snapshot:
+        last = self.__snapshots.get(subject)
+        snapshot = Snapshot(subject=subject,
+                            version=1 if last is None else last.version + 1,
+                            received=received if received is not None else time.time(),
+                            data=StateStore.freeze(data),
+                            sequence=sequence)
+        self.__snapshots[subject] = snapshot
+
+        for listener in self.__listeners.get(subject, []):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logging.exception(e)
+
+        return snapshot
+
+    def get(self, subject: str) -> Snapshot | None:
+        return self.__snapshots.get(subject)
+
+    def version(self, subject: str) -> int:
+        snapshot = self.__snapshots.get(subject)
+        return 0 if snapshot is None else snapshot.version
+
+    def subscribe(self, subject: str, listener):
+        self.__listeners.setdefault(subject, []).append(listener)
+
+    def snapshots(self) -> dict:
+        return dict(self.__snapshots)
@@ -0,0 +1,66 @@
+from collections import Counter
+
+
+class TickHistogram():
+    def __init__(self) -> None:
+        self.__ticks = dict()
+        self.__counts = Counter()
+        self.__leading_tick = None
+        self.__histogram = None
+
+    def update(self, ticks: dict) -> set:
+        changed = set()
+        for computor in list(self.__ticks.keys()):
+            if computor not in ticks:
+                changed.add(self.__ticks[computor])
+                self.__decrement(self.__ticks.pop(computor))
+
+        for computor, tick in ticks.items():
+            old_tick = self.__ticks.get(computor)
+            if old_tick == tick:
+                continue
+
+            if old_tick is not None:
+                changed.add(old_tick)
+                self.__decrement(old_tick)
+
+            changed.add(tick)
+            self.__ticks[computor] = tick
+            self.__counts[tick] += 1
+            if self.__leading_tick is not None and tick > self.__leading_tick:
+                self.__leading_tick = tick
+
+        if len(changed) > 0:
+            self.__histogram = None
+            if self.__leading_tick is None or self.__leading_tick not in self.__counts:
+                self.__leading_tick = max(self.__counts) if len(self.__counts) > 0 else None
+
+        return changed
+
+    def __decrement(self, tick: int):
+        self.__counts[tick] -= 1
+        if self.__counts[tick] <= 0:
+            del self.__counts[tick]
+
+    def __len__(self):
+        return len(self.__ticks)
+
+    def count(self, tick: int) -> int:
+        return self.__counts.get(tick, 0)
+
+    @property
+    def leading_tick(self) -> int | None:
+        return self.__leading_tick
+
+    @property
+    def lagging(self) -> int:
+        if self.__leading_tick is None:
+            return 0
+
+        return len(self.__ticks) - self.__counts[self.__leading_tick]
+
+    def histogram(self) -> list:
+        if self.__histogram is None:
+            self.__histogram = sorted(self.__counts.items(), reverse=True)
+
+        return self.__histogram